@@ -4,20 +4,30 @@
 # Created By  : Nishant Kumar
 # Created Date: 25/02/2022
 # ---------------------------------------------------------------------------
-""" 
+"""
 Convert POD modes to VTK
+    One file per mode, <modesDIR>/VTK/mode_<i>.vtu, written by `nProcs`
+    processes; or with -o, all modes of all given fields as point arrays
+    <field>_mode_<i> of a single file.
 RUN:
-    $ python plot/modeToVTK.py $modesDIR $nModes
+    $ python plot/modeToVTK.py $modesDIR $varSize $nModes [-j nProcs]
+    $ python plot/modeToVTK.py $modesDIR1 $varSize1 $nModes1 $modesDIR2 ... -o $vtkFILE
 """
 
 import numpy as np
 import pandas as po
 import sys
 import os
+import argparse
+import multiprocessing
 # from tqdm import tqdm
 from pathlib import Path
 from pyevtk.hl import pointsToVTK
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'utils'))
+from podBasis import podBasis
+
 # import time as clock
 # start_time = clock.time()
 
@@ -36,15 +46,26 @@ def file_len(fname):
 def make_dir(dirpath):
     Path(dirpath).mkdir(parents=True, exist_ok=True)
 
+#- Converter used by the worker processes
+#- NOTE: Inherited when the pool is forked, so that the coordinates and the
+#-       mapped modes are shared, not copied to each process
+workerConverter = None
+
+def saveModeWorker(i):
+    workerConverter.saveMode(i)
+
 # ---------------------------------------------------------------------------
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class convertModeToVTK():
-    def __init__(self, modesDIR, varSize, nModes):
+    def __init__(self, modesDIR, varSize, nModes, nProcs=1):
         self.modesDIR = modesDIR
         self.varSize = varSize
         self.nModes = nModes
-        
+        self.nProcs = nProcs
+        #- Field name from <podDIR>/modes.<field>
+        self.fieldNAME = os.path.basename(os.path.normpath(modesDIR)).split('.', 1)[-1]
+
     def readData(self):
         fieldDIR = os.path.join(self.modesDIR,'..','internalField')
         #- List of pointCloud* files (NOT full path)
@@ -52,70 +73,123 @@ class convertModeToVTK():
         for f in os.listdir(fieldDIR):
             if f.startswith('pointCloud'):
                 coordFILES.append(os.path.basename(f))
-        #- Assign coordinate file 
+        #- Candidate coordinate files, in order of preference
+        #- NOTE: The masked coordinates (written with less precision) are only
+        #-       used if the modes are masked
+        candidates = []
+        if 'pointCloud.xy' in coordFILES:
+            candidates.append(('pointCloud.xy', [0,1,2]))
+        elif 'pointCloud.dat' in coordFILES:
+            candidates.append(('pointCloud.dat', [1,2,3]))
         if 'pointCloud.mask' in coordFILES:
-            self.coordFILE = os.path.join(fieldDIR,'pointCloud.mask')
-            useInd = [0,1,2]
-        else:
-            if 'pointCloud.xy' in coordFILES:
-                self.coordFILE = os.path.join(fieldDIR,'pointCloud.xy')
-                useInd = [0,1,2]
-            elif 'pointCloud.dat' in coordFILES:
-                self.coordFILE = os.path.join(fieldDIR,'pointCloud.dat')
-                useInd = [1,2,3]
-
-        pts = po.read_csv(self.coordFILE, 
-                          delim_whitespace=True, 
-                          header=None, 
-                          names=['x', 'y', 'z'], 
-                          usecols=useInd)
-        self.x = pts[['x']].to_numpy().squeeze()
-        self.y = pts[['y']].to_numpy().squeeze()
-        self.z = pts[['z']].to_numpy().squeeze()
+            candidates.append(('pointCloud.mask', [0,1,2]))
+
+        for coordFILE, useInd in candidates:
+            self.coordFILE = os.path.join(fieldDIR, coordFILE)
+            pts = po.read_csv(self.coordFILE,
+                              delim_whitespace=True,
+                              header=None,
+                              names=['x', 'y', 'z'],
+                              usecols=useInd)
+            try:
+                #- Read the modes
+                #- NOTE: Memory-mapped, each mode is read when written
+                basis = podBasis(self.modesDIR, len(pts), self.varSize)
+                break
+            except ValueError:
+                if coordFILE == candidates[-1][0]:
+                    raise
+        print('\nReading modes from binary files...\n')
+        self.mode = basis.raw[:self.nModes]
+
+        #- Coordinates, shared by all modes
+        self.x = np.ascontiguousarray(pts['x'].to_numpy())
+        self.y = np.ascontiguousarray(pts['y'].to_numpy())
+        self.z = np.ascontiguousarray(pts['z'].to_numpy())
 
         #- Size
         self.MM = len(self.x)
 
-        self.x = self.x.reshape(self.MM, 1, order='C')
-        self.y = self.y.reshape(self.MM, 1, order='C')
-        self.z = self.z.reshape(self.MM, 1, order='C')
+    def modeData(self, i):
+        #- NOTE: Tuple data is identified as vector in pointsToVTK; the
+        #-       components are views of the mapped mode
+        if self.varSize == 1:
+            return self.mode[i, :]
+        MM = self.MM
+        return tuple(self.mode[i, j*MM:(j+1)*MM] for j in range(self.varSize))
 
-        #- Read the modes
-        print('\nReading modes from binary files...\n')
-        self.mode = np.fromfile(self.modesDIR+'/mode.bin', dtype=float)
-        self.mode = self.mode.reshape(self.nModes, self.varSize*self.MM)
+    def saveMode(self, i):
+        pointsToVTK(self.vtkDIR+"/mode_%s"%(str(i)),
+                    self.x, self.y, self.z,
+                    data={"mode": self.modeData(i)})
 
     def saveVTK(self):
-        vtkDIR = self.modesDIR+"/VTK"
-        make_dir(vtkDIR)
+        global workerConverter
+        self.vtkDIR = self.modesDIR+"/VTK"
+        make_dir(self.vtkDIR)
         print('\nWriting the modes in VTK files...\n')
-        MM = self.MM
         # for i in tqdm(range(self.nModes)):
-        for i in range(self.nModes):
-            #- NOTE: Tuple data is identified as vector in pointsToVTK
-            if self.varSize == 1:
-                modei = self.mode[i, :]
-            else:
-                modei = ()
-                for j in range(self.varSize):
-                    modei += (self.mode[i, j*MM:(j+1)*MM], )
-            pointsToVTK(vtkDIR+"/mode_%s"%(str(i)), 
-                        self.x, self.y, self.z, 
-                        data={"mode": modei})
+        if self.nProcs <= 1:
+            for i in range(self.nModes):
+                self.saveMode(i)
+            return
+        #- Modes written concurrently by forked processes
+        workerConverter = self
+        with multiprocessing.get_context('fork').Pool(self.nProcs) as pool:
+            pool.map(saveModeWorker, range(self.nModes),
+                     chunksize=max(1, self.nModes//(4*self.nProcs)))
+        workerConverter = None
+
+def saveCombinedVTK(converters, vtkFILE):
+    #- All modes of all fields in one file, as arrays <field>_mode_<i>
+    #- NOTE: The fields must share the coordinates
+    p0 = converters[0]
+    data = {}
+    for p in converters:
+        if p.MM != p0.MM or not (np.array_equal(p.x, p0.x) and
+                                 np.array_equal(p.y, p0.y) and np.array_equal(p.z, p0.z)):
+            raise ValueError("Coordinates of {0} differ from {1}".format(
+                             p.modesDIR, p0.modesDIR))
+        for i in range(p.nModes):
+            data['{0}_mode_{1}'.format(p.fieldNAME, i)] = p.modeData(i)
+    make_dir(os.path.dirname(os.path.abspath(vtkFILE)))
+    print('\nWriting {0:d} modes in {1}...\n'.format(len(data), vtkFILE))
+    pointsToVTK(os.path.splitext(vtkFILE)[0], p0.x, p0.y, p0.z, data=data)
 
 # ---------------------------------------------------------------------------
 # MAIN FUNCTION
 # ---------------------------------------------------------------------------
 def main():
     #- Read arguments
-    #- NOTE: sys.argv[0] is always the script name
-    modesDIR = sys.argv[1]
-    varSize = int(sys.argv[2])
-    nModes = int(sys.argv[3])
+    CLI = argparse.ArgumentParser(description='Convert POD modes to VTK')
+    CLI.add_argument('modes',
+                    help="modesDIR varSize nModes, repeated for several fields",
+                    nargs='*',
+                    type=str)
+    CLI.add_argument('-j', '--nProcs',
+                    help="Number of processes writing modes",
+                    nargs='?',
+                    type=int,
+                    default=1)
+    CLI.add_argument('-o', '--combinedFILE',
+                    help="Single VTK file for all modes of all fields (optional)",
+                    nargs='?',
+                    type=str)
+    args = CLI.parse_args()
+    assert len(args.modes) > 0 and len(args.modes)%3 == 0, \
+           f"Expected modesDIR varSize nModes (repeated), got {args.modes}"
+
+    converters = []
+    for modesDIR, varSize, nModes in zip(*[iter(args.modes)]*3):
+        p = convertModeToVTK(modesDIR, int(varSize), int(nModes), args.nProcs)
+        p.readData()
+        converters.append(p)
 
-    p = convertModeToVTK(modesDIR, varSize, nModes)
-    p.readData()
-    p.saveVTK()
+    if args.combinedFILE:
+        saveCombinedVTK(converters, args.combinedFILE)
+    else:
+        for p in converters:
+            p.saveVTK()
 
     print('\nDONE!...\n')
 
@@ -123,4 +197,4 @@ def main():
 # COMMAND LINE EXECUTION
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
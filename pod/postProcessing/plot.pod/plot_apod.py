@@ -12,11 +12,16 @@ NOTE: (Obsolete) Prefer gnuplot script plot_apod.p
 import numpy as np
 import pandas as po
 import sys
+import os
 from tqdm import tqdm
 from pathlib import Path
 
 import matplotlib.pyplot as plt
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'utils'))
+from podBasis import loadChronos
+
 # ---------------------------------------------------------------------------
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
@@ -40,8 +45,7 @@ class readChronos():
 
         #- Read chronos
         # print('\nReading chronos from binary files...\n')
-        self.chronos = np.fromfile(self.chronosDIR+'/chronos.bin', dtype=float)
-        self.chronos = self.chronos.reshape(self.nt, self.nModes)
+        self.chronos = loadChronos(self.chronosDIR, self.nModes, self.nt)
         
     def plotter(self):
         nModesPlot=10
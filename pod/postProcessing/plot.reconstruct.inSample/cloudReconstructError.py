@@ -6,13 +6,28 @@
 # ---------------------------------------------------------------------------
 """ 
 Calculate reconstruction error between the simulated and reconstructed fields
+    Besides the NRMSE, saved in the reconstruction directory:
+        reconError.snapshot.dat - time, |U-U_R|, |U|, relative error per snapshot
+        reconError.component.dat - RMS error, RMS of U, relative error per component
+        reconError.point.xy - x y z, RMS error per component and of the magnitude
+                              over all snapshots, per point
+    The snapshots are read by `nWorkers` threads (0: default) in chunks of
+    `chunkSize` (default: all), which sets the peak memory; reconstruction.bin
+    is memory-mapped.
+RUN:
+    $ python cloudReconstructError.py $timeFile $pointFile $snapsDir $recDir \
+        [nWorkers] [chunkSize]
 """
 
 import numpy as np
 import pandas as po
 import os
 import sys
-from tqdm import tqdm
+from pathlib import Path
+
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'utils'))
+from snapshotStore import snapshotReader
 
 # ---------------------------------------------------------------------------
 # UTILITY FUNCTION(S)
@@ -25,12 +40,16 @@ def make_dir(dirpath):
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class calculateReconError():
-    def __init__(self, timeFile, pointFile, snapsDir, recDir):
+    def __init__(self, timeFile, pointFile, snapsDir, recDir, nWorkers=None, chunkSize=None):
         self.timeFile = timeFile
         self.pointFile = pointFile
         self.snapsDir = snapsDir
         self.recDir = recDir
         self.varSize = 3
+        #- Threads reading snapshots (default: ThreadPoolExecutor's)
+        self.nWorkers = nWorkers
+        #- Snapshots processed at once (default: all)
+        self.chunkSize = chunkSize
 
     def readData(self):
         #- Select time directories
@@ -63,34 +82,64 @@ class calculateReconError():
         assert(len(self.x) == len(self.y))
         assert(len(self.y) == len(self.z))
 
-        #- Read the original field
-        self.U_V = np.zeros([self.varSize*self.MM, self.N],'float')
-        print('\nReading initial velocity fields from dat files...\n')
-        for i in tqdm(range(self.N)):
-            t = self.timeList[i]
-            self.U_V[:,i] = np.loadtxt(self.snapsDir+'/%s/cloud_U.xy' 
-                            %(str(t if t%1 else int(t))), 
-                            skiprows=0, 
-                            unpack=True).reshape(self.varSize*self.MM)
-
-        #- Read the reconstructed field
-        print('\nReading reconstructed velocity fields from binary files...\n')
-        self.U_R_V = np.fromfile(self.recDir+'/reconstruction.bin', dtype=float)
-        self.U_R_V = self.U_R_V.reshape(self.N, self.varSize*self.MM)
+        #- Original field, read chunk-wise
+        self.snapReader = snapshotReader(self.snapsDir)
+        self.timeNames = [str(t if t%1 else int(t)) for t in self.timeList]
+
+        #- Reconstructed field
+        #- NOTE: Memory-mapped, only the rows of a chunk are read at a time
+        self.U_R_V = np.memmap(self.recDir+'/reconstruction.bin', dtype=float, mode='r',
+                               shape=(self.N, self.varSize*self.MM))
 
     def reconError(self):
-        MM = self.MM
-        nrmse = 0
-        for i in tqdm(range(self.N)):
-            U_V_C = np.ascontiguousarray(self.U_V[:,i], dtype=np.float32)
-            U = (U_V_C[:MM], U_V_C[MM:2*MM], U_V_C[2*MM:3*MM])
-            U_R = (self.U_R_V[i, :MM], self.U_R_V[i, MM:2*MM], self.U_R_V[i, 2*MM:3*MM])
-            nrmse += np.sqrt(np.sum((U[0]-U_R[0])**2 + 
-                                    (U[1]-U_R[1])**2 +
-                                    (U[2]-U_R[2])**2)) / np.sqrt(np.sum(
-                                     U[0]**2 + U[1]**2 + U[2]**2)
-                                    )/np.sqrt(self.N)/np.sqrt(MM)
-        return nrmse
+        #- Squared error and squared field summed per snapshot, and per point
+        #- and component over the snapshots, accumulated chunk by chunk
+        chunkSize = min(self.chunkSize or self.N, self.N)
+        self.errSqSnap = np.zeros(self.N)
+        self.refSqSnap = np.zeros(self.N)
+        self.errSqPoint = np.zeros((self.MM, self.varSize))
+        self.refSqPoint = np.zeros((self.MM, self.varSize))
+        #- NOTE: Component-wise stacking, i.e. [Ux, Uy, Uz], as in the 
+        #-       reconstruction; snapshots are read in parallel
+        U_V = np.empty((chunkSize, self.varSize, self.MM))
+        print('\nReading and comparing velocity fields in chunks of {0:d}...\n'.format(chunkSize))
+        for i0 in range(0, self.N, chunkSize):
+            i1 = min(i0+chunkSize, self.N)
+            U = self.snapReader.readMany(self.timeNames[i0:i1], 'U', out=U_V[:i1-i0],
+                                         nWorkers=self.nWorkers)
+            E = U-self.U_R_V[i0:i1].reshape((i1-i0, self.varSize, self.MM))
+            self.errSqSnap[i0:i1] = np.einsum('ijk,ijk->i', E, E)
+            self.refSqSnap[i0:i1] = np.einsum('ijk,ijk->i', U, U)
+            self.errSqPoint += np.einsum('ijk,ijk->kj', E, E)
+            self.refSqPoint += np.einsum('ijk,ijk->kj', U, U)
+        return self.nrmse()
+
+    def nrmse(self):
+        #- Mean over snapshots of the relative L2 error, per sqrt(points)
+        relErr = np.sqrt(self.errSqSnap)/np.sqrt(self.refSqSnap)
+        return np.sum(relErr)/np.sqrt(self.N)/np.sqrt(self.MM)
+
+    def saveError(self):
+        #- Per snapshot
+        errSnap = np.sqrt(self.errSqSnap)
+        refSnap = np.sqrt(self.refSqSnap)
+        np.savetxt(os.path.join(self.recDir, 'reconError.snapshot.dat'),
+                   np.column_stack((self.timeList, errSnap, refSnap, errSnap/refSnap)),
+                   fmt='%g', header='time errL2 refL2 relErrL2')
+
+        #- Per component (RMS over snapshots and points)
+        errComp = np.sqrt(self.errSqPoint.sum(axis=0)/(self.N*self.MM))
+        refComp = np.sqrt(self.refSqPoint.sum(axis=0)/(self.N*self.MM))
+        np.savetxt(os.path.join(self.recDir, 'reconError.component.dat'),
+                   np.column_stack((np.arange(self.varSize), errComp, refComp, errComp/refComp)),
+                   fmt='%g', header='component errRMS refRMS relErrRMS')
+
+        #- Per point (RMS over snapshots)
+        errPoint = np.sqrt(self.errSqPoint/self.N)
+        errPointMag = np.sqrt(self.errSqPoint.sum(axis=1)/self.N)
+        np.savetxt(os.path.join(self.recDir, 'reconError.point.xy'),
+                   np.column_stack((self.x, self.y, self.z, errPoint, errPointMag)),
+                   fmt='%g', delimiter='\t')
 
 # ---------------------------------------------------------------------------
 # MAIN FUNCTION
@@ -102,10 +151,13 @@ def main():
     pointFile = sys.argv[2]
     snapsDir = sys.argv[3]
     recDir = sys.argv[4]
+    nWorkers = int(sys.argv[5]) or None if len(sys.argv) > 5 else None
+    chunkSize = int(sys.argv[6]) if len(sys.argv) > 6 else None
 
-    p = calculateReconError(timeFile, pointFile, snapsDir, recDir)
+    p = calculateReconError(timeFile, pointFile, snapsDir, recDir, nWorkers, chunkSize)
     p.readData()
     nrmse = p.reconError()
+    p.saveError()
 
     print('\nSnapshot directory: %s' % (snapsDir))
     print('\nReconstruction directory: %s' % (recDir))
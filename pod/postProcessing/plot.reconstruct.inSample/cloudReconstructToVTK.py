@@ -6,17 +6,29 @@
 # ---------------------------------------------------------------------------
 """ 
 Convert reconstructed field in the form of cloud point data to VTK
-USAGE: python cloudReconstructToVTK.py [timeList] [coordList] [snapsDir] [recDir]
+USAGE: python cloudReconstructToVTK.py [timeList] [coordList] [snapsDir] [recDir] [nWorkers] \
+           [chunkSize] [outFormat]
+    Same optional arguments as cloudReconstructError.py: the snapshots are
+    read by `nWorkers` threads (0: default) in chunks of `chunkSize` (default:
+    all), which sets the peak memory; reconstruction.bin is memory-mapped.
+    outFormat: vtu - one file per snapshot (default), vtkhdf or pvd - time
+    series VTK/U.vtkhdf or VTK/U.pvd (see utils/vtkSeries.py)
 """
 
 import numpy as np
 import pandas as po
+import os
 import sys
 from tqdm import tqdm
 from pathlib import Path
 
 from pyevtk.hl import pointsToVTK
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'utils'))
+from snapshotStore import snapshotReader
+from vtkSeries import vtkSeriesWriter
+
 # ---------------------------------------------------------------------------
 # UTILITY FUNCTION(S)
 # ---------------------------------------------------------------------------
@@ -28,12 +40,18 @@ def make_dir(dirpath):
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class convertReconToVTK():
-    def __init__(self, timeFile, pointFile, snapsDir, recDir):
+    def __init__(self, timeFile, pointFile, snapsDir, recDir, nWorkers=None, chunkSize=None, 
+                 outFormat='vtu'):
         self.timeFile = timeFile
         self.pointFile = pointFile
         self.snapsDir = snapsDir
         self.recDir = recDir
         self.varSize = 3
+        #- Threads reading the snapshots of a chunk
+        self.nWorkers = nWorkers
+        #- Snapshots processed at once (default: all)
+        self.chunkSize = chunkSize
+        self.outFormat = outFormat
 
     def readData(self):
         #- Select time directories
@@ -66,33 +84,44 @@ class convertReconToVTK():
         assert(len(self.x) == len(self.y))
         assert(len(self.y) == len(self.z))
 
-        #- Read the original field
-        self.U_V = np.zeros([self.varSize*self.MM, self.N],'float')
-        print('\nReading initial velocity fields from dat files...\n')
-        for i in tqdm(range(self.N)):
-            t = self.timeList[i]
-            self.U_V[:,i] = np.loadtxt(self.snapsDir+'/%s/cloud_U.xy' 
-                            %(str(t if t%1 else int(t))), 
-                            skiprows=0, 
-                            unpack=True).reshape(self.varSize*self.MM)
-
-        #- Read the reconstructed field
-        print('\nReading reconstructed velocity fields from binary files...\n')
-        self.U_R_V = np.fromfile(self.recDir+'/reconstruction.bin', dtype=float)
-        self.U_R_V = self.U_R_V.reshape(self.N, self.varSize*self.MM)
+        #- Original field, read chunk-wise
+        self.snapReader = snapshotReader(self.snapsDir)
+        self.timeNames = [str(t if t%1 else int(t)) for t in self.timeList]
+
+        #- Reconstructed field
+        #- NOTE: Memory-mapped, only the rows of a chunk are read at a time
+        self.U_R_V = np.memmap(self.recDir+'/reconstruction.bin', dtype=float, mode='r',
+                               shape=(self.N, self.varSize*self.MM))
 
     def saveVTK(self):
         vtkDir = self.recDir+"/VTK/"
         make_dir(vtkDir)
         print('\nWriting the fields and reconstructions in VTK files...\n')
         MM = self.MM
-        for i in tqdm(range(self.N)):
-            t = self.timeList[i]
-            U_V_C = np.ascontiguousarray(self.U_V[:,i], dtype=np.float32)
-            U = (U_V_C[:MM], U_V_C[MM:2*MM], U_V_C[2*MM:3*MM])
-            U_R = (self.U_R_V[i, :MM], self.U_R_V[i, MM:2*MM], self.U_R_V[i, 2*MM:3*MM])
-            pointsToVTK(vtkDir+"U_%s"%(str(t if t % 1 else int(t))), 
-                    self.x, self.y, self.z, data={"U": U, "U_R": U_R})
+        chunkSize = min(self.chunkSize or self.N, self.N)
+        #- NOTE: Component-wise stacking, i.e. [Ux, Uy, Uz]
+        U_V = np.empty((chunkSize, self.varSize, MM))
+        if self.outFormat != 'vtu':
+            series = vtkSeriesWriter(vtkDir+'U', np.column_stack((self.x, self.y, self.z)),
+                                     self.outFormat)
+        for i0 in tqdm(range(0, self.N, chunkSize)):
+            i1 = min(i0+chunkSize, self.N)
+            self.snapReader.readMany(self.timeNames[i0:i1], 'U', out=U_V[:i1-i0], 
+                                     nWorkers=self.nWorkers)
+            for i in range(i0, i1):
+                if self.outFormat != 'vtu':
+                    series.write(self.timeList[i], 
+                                 {"U": U_V[i-i0].T, 
+                                  "U_R": self.U_R_V[i].reshape((self.varSize, MM)).T})
+                    continue
+                U_V_C = np.ascontiguousarray(U_V[i-i0], dtype=np.float32)
+                U = (U_V_C[0], U_V_C[1], U_V_C[2])
+                U_R_V = np.array(self.U_R_V[i])
+                U_R = (U_R_V[:MM], U_R_V[MM:2*MM], U_R_V[2*MM:3*MM])
+                pointsToVTK(vtkDir+"U_%s"%(self.timeNames[i]), 
+                        self.x, self.y, self.z, data={"U": U, "U_R": U_R})
+        if self.outFormat != 'vtu':
+            series.close()
 
 # ---------------------------------------------------------------------------
 # MAIN FUNCTION
@@ -104,8 +133,11 @@ def main():
     pointFile = sys.argv[2]
     snapsDir = sys.argv[3]
     recDir = sys.argv[4]
+    nWorkers = int(sys.argv[5]) or None if len(sys.argv) > 5 else None
+    chunkSize = int(sys.argv[6]) if len(sys.argv) > 6 else None
+    outFormat = sys.argv[7] if len(sys.argv) > 7 else 'vtu'
 
-    p = convertReconToVTK(timeFile, pointFile, snapsDir, recDir)
+    p = convertReconToVTK(timeFile, pointFile, snapsDir, recDir, nWorkers, chunkSize, outFormat)
     p.readData()
     p.saveVTK()
 
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Assemble the snapshots of all sample runs for POD
+    Replaces createSnapshots.sh: each sample run is scanned once (in parallel),
+    its point count checked against the coordinate file once, and the
+    catalogue of snapshots written as a manifest (json):
+        runs      - per run: index, sample directory, snapshot directory,
+                    coordinate file, number of points, and per field the
+                    cloud file and its columns
+        nv        - number of components per field
+        snapshots - [run index, time, <run>.<time>] in run-time order
+        mask      - mask file (.npy) and number of points kept, with -k
+    together with the list of <run>.<time> names (timeListSamples).
+    The directories <snapsOutDIR>/<run>.<time> read by the POD executable are
+    linked only with -l (existing links are kept). With -k, the points in
+    `maskRegion` of the input file are masked (createMask.py) and the
+    directories hold masked copies instead: cloud_<field>.xy with the field
+    columns of the points kept, read by the POD executable together with the
+    coordinates pointCloud.mask.
+RUN:
+    $ python assembleSnapshots.py -t $timeList -s $timeListSamples -o $snapsOutDIR \
+        -f p U [-i ./preProcessing/userInput.json] [-l] [-k]
+"""
+
+import argparse
+import json
+import os
+import sys
+import shutil
+import pandas as po
+from concurrent.futures import ThreadPoolExecutor
+
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils'))
+from snapshotStore import cloudFields, fieldSize, loadMask
+
+# ---------------------------------------------------------------------------
+# UTILITY FUNCTION(S)
+# ---------------------------------------------------------------------------
+#- Relative paths in a sample directory
+snapsRELPATH = os.path.join('postProcessing', 'internalField')
+coordRELPATH = os.path.join('system', 'sampling', 'pointCloud.dat')
+# snapsRELPATH = os.path.join('postProcessing', 'boundaryField')
+# coordRELPATH = os.path.join('system', 'sampling', 'getBoundaryPoints', 'faceCenter.xy')
+
+def countLines(fileNAME, blockBytes=16*1024**2):
+    #- Number of data lines (leading '#' lines are not counted)
+    nLines = 0
+    nHeader = 0
+    last = b'\n'
+    with open(fileNAME, 'rb') as f:
+        line = f.readline()
+        while line.startswith(b'#'):
+            nHeader += 1
+            line = f.readline()
+        f.seek(0)
+        block = f.read(blockBytes)
+        while block:
+            nLines += block.count(b'\n')
+            last = block[-1:]
+            block = f.read(blockBytes)
+    #- Last line without newline
+    nLines += last != b'\n'
+    return nLines-nHeader
+
+def countColumns(fileNAME):
+    #- Number of columns of the first data line
+    with open(fileNAME) as f:
+        line = f.readline()
+        while line.startswith('#'):
+            line = f.readline()
+    return len(line.split())
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class snapshotAssembler():
+    def __init__(self, sampleDirectories, timeNames, fieldNames, snapsOutDIR):
+        self.sampleDirectories = sampleDirectories
+        self.timeNames = timeNames
+        self.fieldNames = fieldNames
+        self.snapsOutDIR = os.path.abspath(snapsOutDIR)
+
+        #- Number of runs scanned (or directories linked) at once
+        self.nWorkers = min(32, (os.cpu_count() or 1)+4)
+        #- Mask file (.npy) of the points dropped, see mask()
+        self.maskFILE = None
+
+    def scan(self):
+        #- Catalogue of all runs, scanned in parallel
+        with ThreadPoolExecutor(self.nWorkers) as pool:
+            self.runs = list(pool.map(self._scanRun, range(1, len(self.sampleDirectories)+1),
+                                      self.sampleDirectories))
+
+        #- Runs are stacked in the POD, so they must share points and fields
+        run0 = self.runs[0]
+        for run in self.runs[1:]:
+            if run['nPts'] != run0['nPts']:
+                raise ValueError("Run {0} has {1} points, run 1 has {2}".format(
+                                 run['index'], run['nPts'], run0['nPts']))
+        self.nv = {fld: len(run0['fields'][fld]['columns']) for fld in self.fieldNames}
+        self.snapshots = [[run['index'], t, '{0}.{1}'.format(run['index'], t)]
+                          for run in self.runs for t in self.timeNames]
+
+    def save(self, manifestFILE, timeListSamples):
+        os.makedirs(self.snapsOutDIR, exist_ok=True)
+        manifest = {'format': 'snapshotManifest',
+                    'version': 1,
+                    'snapsDIR': self.snapsOutDIR,
+                    'runs': self.runs,
+                    'nv': self.nv,
+                    'snapshots': self.snapshots}
+        if self.maskFILE is not None:
+            manifest['mask'] = {'file': self.maskFILE,
+                                'nPts': len(loadMask(self.maskFILE)[1])}
+        tmpFILE = manifestFILE+'.tmp'
+        with open(tmpFILE, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmpFILE, manifestFILE)
+        with open(timeListSamples, 'w') as f:
+            f.write(''.join(s[2]+'\n' for s in self.snapshots))
+
+        #- Coordinates (shared by all runs)
+        coordFILE = self.runs[0]['coordFILE']
+        shutil.copy2(coordFILE, os.path.join(self.snapsOutDIR, os.path.basename(coordFILE)))
+
+    def link(self):
+        #- Directories <snapsOutDIR>/<run>.<time> for the POD executable
+        runPath = {run['index']: run['snapsDIR'] for run in self.runs}
+        tasks = [(os.path.join(runPath[i], t), os.path.join(self.snapsOutDIR, name))
+                 for i, t, name in self.snapshots]
+        with ThreadPoolExecutor(self.nWorkers) as pool:
+            nNew = sum(pool.map(lambda task: self._link(*task), tasks))
+        print('Linked {0:d} of {1:d} snapshots'.format(nNew, len(tasks)))
+
+    def writeMasked(self):
+        #- Directories <snapsOutDIR>/<run>.<time> of masked snapshots for the
+        #- POD executable: cloud_<field>.xy with the field columns of the
+        #- points kept by the mask, values copied as text
+        _, keepInd = loadMask(self.maskFILE)
+        runs = {run['index']: run for run in self.runs}
+        tasks = [(runs[i], t, name) for i, t, name in self.snapshots]
+        with ThreadPoolExecutor(self.nWorkers) as pool:
+            for _ in pool.map(lambda task: self._writeMasked(*task, keepInd), tasks):
+                pass
+        print('Masked {0:d} snapshots'.format(len(tasks)))
+
+    def mask(self, maskRegion):
+        #- Mask (see createMask.py) of the coordinates, saved to `snapsOutDIR`
+        from createMask import spatialFilter
+        os.makedirs(self.snapsOutDIR, exist_ok=True)
+        coordFILE = self.runs[0]['coordFILE']
+        coordMaskFILE = os.path.join(self.snapsOutDIR,
+                                     os.path.splitext(os.path.basename(coordFILE))[0]+'.mask')
+        fp = {'coordOutFILE': coordFILE,
+              'coordMaskFILE': coordMaskFILE,
+              'coordMaskIndFILE': coordMaskFILE+'.index'}
+        p = spatialFilter(maskRegion, fp)
+        p.maskPoints()
+        p.savedat()
+        self.maskFILE = coordMaskFILE+'.npy'
+        print('Masked points: {0:d} of {1:d}'.format(len(p.maskInd), len(p.maskFilter)))
+
+    def _scanRun(self, runIndex, sampleDIR):
+        snapsDIR = os.path.join(sampleDIR, snapsRELPATH)
+
+        #- Coordinates: .xy version of the point cloud, if present
+        coordFILE = os.path.join(sampleDIR, coordRELPATH)
+        coordxyFILE = os.path.splitext(coordFILE)[0]+'.xy'
+        if os.path.isfile(coordxyFILE):
+            coordFILE = coordxyFILE
+        nPts = countLines(coordFILE)
+
+        #- Time directories, listed once
+        with os.scandir(snapsDIR) as it:
+            available = set(entry.name for entry in it if entry.is_dir())
+        missing = [t for t in self.timeNames if t not in available]
+        if missing:
+            raise FileNotFoundError("Run {0}: {1} time(s) not found in {2}, e.g. {3}".format(
+                                    runIndex, len(missing), snapsDIR, missing[:5]))
+
+        #- Field layout of the first time, assumed for all times
+        timeDIR = os.path.join(snapsDIR, self.timeNames[0])
+        fields = {}
+        for cloudFILE in sorted(os.listdir(timeDIR)):
+            if not cloudFILE.startswith('cloud_'):
+                continue
+            availFields = cloudFields(cloudFILE)
+            if not any(fld in self.fieldNames for fld in availFields):
+                continue
+            cloudPATH = os.path.join(timeDIR, cloudFILE)
+            nCol = countColumns(cloudPATH)
+            nColFields = sum(fieldSize(fld) for fld in availFields)
+            if nCol not in [nColFields, nColFields+3]:
+                raise ValueError("DATA COLUMNS MISMATCH ERROR: Needed {0}, found {1} in {2}".format(
+                                 nColFields, nCol, cloudPATH))
+            #- Points are checked once per run
+            nLines = countLines(cloudPATH)
+            if nLines != nPts:
+                raise ValueError("GRID POINTS MISMATCH ERROR: {0} has {1} points, {2} has {3}".format(
+                                 cloudPATH, nLines, coordFILE, nPts))
+            colStart = nCol-nColFields
+            for fld in availFields:
+                nv = fieldSize(fld)
+                if fld in self.fieldNames:
+                    fields[fld] = {'file': cloudFILE,
+                                   'columns': list(range(colStart, colStart+nv))}
+                colStart += nv
+        missing = [fld for fld in self.fieldNames if fld not in fields]
+        if missing:
+            raise FileNotFoundError("Run {0}: field(s) {1} not found in {2}".format(
+                                    runIndex, missing, timeDIR))
+
+        return {'index': runIndex,
+                'sampleDIR': sampleDIR,
+                'snapsDIR': os.path.abspath(snapsDIR),
+                'coordFILE': os.path.abspath(coordFILE),
+                'nPts': nPts,
+                'fields': fields}
+
+    def _writeMasked(self, run, t, name, keepInd):
+        outDIR = os.path.join(self.snapsOutDIR, name)
+        #- NOTE: A link of an earlier run without mask is replaced, the sample
+        #-       directory it points to is not written to
+        if os.path.islink(outDIR):
+            os.remove(outDIR)
+        os.makedirs(outDIR, exist_ok=True)
+        #- Fields of a cloud file, read once
+        cloudFiles = {}
+        for fld, layout in run['fields'].items():
+            cloudFiles.setdefault(layout['file'], []).append(fld)
+        for cloudFILE, fields in cloudFiles.items():
+            useInd = sorted(c for fld in fields for c in run['fields'][fld]['columns'])
+            values = po.read_csv(os.path.join(run['snapsDIR'], t, cloudFILE),
+                                 header=None,
+                                 delim_whitespace=True,
+                                 usecols=useInd,
+                                 dtype=str)
+            if len(values) != run['nPts']:
+                raise ValueError("GRID POINTS MISMATCH ERROR: {0} has {1} points, {2} has {3}".format(
+                                 os.path.join(run['snapsDIR'], t, cloudFILE), len(values),
+                                 run['coordFILE'], run['nPts']))
+            values = values.iloc[keepInd]
+            for fld in fields:
+                values[run['fields'][fld]['columns']].to_csv(
+                    os.path.join(outDIR, 'cloud_'+fld+'.xy'),
+                    sep='\t', header=False, index=False)
+
+    def _link(self, target, linkPATH):
+        #- NOTE: Returns whether a link was created
+        if os.path.islink(linkPATH):
+            if os.readlink(linkPATH) == target:
+                return False
+            os.remove(linkPATH)
+        os.symlink(target, linkPATH)
+        return True
+
+# ---------------------------------------------------------------------------
+# MAIN FUNCTION
+# ---------------------------------------------------------------------------
+def main():
+    #- Read arguments
+    CLI = argparse.ArgumentParser(description='Assemble snapshots of all sample runs')
+    CLI.add_argument('-t', '--timeList',
+                    help="List of time steps",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-s', '--timeListSamples',
+                    help="Output list of <run>.<time> snapshots",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-o', '--snapsOutDIR',
+                    help="Output snapshots directory",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-f', '--fieldNAME',
+                    help="Field name(s)",
+                    nargs='*',
+                    type=str,
+                    default=['U'])
+    CLI.add_argument('-i', '--inputFILE',
+                    help="Input file",
+                    nargs='?',
+                    type=str,
+                    default='./preProcessing/userInput.json')
+    CLI.add_argument('-m', '--manifestFILE',
+                    help="Output manifest (default: <snapsOutDIR>/snapshots.json)",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-l', '--link',
+                    help="Link <snapsOutDIR>/<run>.<time> to the snapshot directories",
+                    action='store_true')
+    CLI.add_argument('-k', '--mask',
+                    help="Mask the points in `maskRegion` of the input file (createMask.py) "
+                         "and write masked snapshots <snapsOutDIR>/<run>.<time> (instead of -l)",
+                    action='store_true')
+
+    try:
+        args = CLI.parse_args()
+    except SystemExit:
+        print("Check inputs")
+        quit()
+
+    with open(args.inputFILE) as f:
+        inputJSON = json.load(f)
+    with open(args.timeList) as f:
+        timeNames = f.read().split()
+    manifestFILE = args.manifestFILE if args.manifestFILE \
+                   else os.path.join(args.snapsOutDIR, 'snapshots.json')
+
+    p = snapshotAssembler(inputJSON['sampleDirectories'], timeNames,
+                          args.fieldNAME, args.snapsOutDIR)
+    p.scan()
+    if args.mask:
+        p.mask(inputJSON.get('maskRegion', {}))
+    p.save(manifestFILE, args.timeListSamples)
+    if args.mask:
+        p.writeMasked()
+    elif args.link:
+        p.link()
+    print('{0:d} snapshots of {1:d} run(s): {2}'.format(
+          len(p.snapshots), len(p.runs), manifestFILE))
+
+# ---------------------------------------------------------------------------
+# COMMAND LINE EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
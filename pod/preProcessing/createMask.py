@@ -4,8 +4,28 @@
 # Created By  : Nishant Kumar
 # Created Date: 21/12/2021
 # ---------------------------------------------------------------------------
-""" 
+"""
 Generate mask points
+    Masked region (e.g. to exclude from POD calculation) is read from the key
+    `maskRegion` of the input file:
+        "maskRegion" : {
+            "union" : [ <region>, ... ],
+            "difference" : [ <region>, ... ]
+        }
+    A point is masked if it lies in any region of `union` and in no region of
+    `difference`. Regions (bounds included):
+        {"type": "box", "xyzMin": [x,y,z], "xyzMax": [x,y,z]}
+        {"type": "sphere", "center": [x,y,z], "radius": r}
+        {"type": "cylinder", "p0": [x,y,z], "p1": [x,y,z], "radius": r}
+    Outputs:
+        coordMaskFILE           - coordinates of the points kept (text)
+        coordMaskFILE.prm       - number of points kept, mask region (json)
+        coordMaskFILE.npy       - bool (nPts,), True for masked points
+        coordMaskIndFILE        - index of masked points (text)
+        coordMaskIndFILE.npy    - int64, index of masked points
+RUN:
+    $ python createMask.py $coordOutFILE $coordMaskFILE $coordMaskIndFILE \
+        -i ./preProcessing/userInput.json
 """
 
 import numpy as np
@@ -13,6 +33,42 @@ import sys
 import os
 import pandas as po
 import json
+import argparse
+
+# ---------------------------------------------------------------------------
+# UTILITY FUNCTION(S)
+# ---------------------------------------------------------------------------
+def inBox(coord, region):
+    xyzMin = np.asarray(region['xyzMin'], dtype=float)
+    xyzMax = np.asarray(region['xyzMax'], dtype=float)
+    return np.all((xyzMin <= coord) & (xyzMax >= coord), axis=1)
+
+def inSphere(coord, region):
+    d = coord-np.asarray(region['center'], dtype=float)
+    return np.einsum('ij,ij->i', d, d) <= float(region['radius'])**2
+
+def inCylinder(coord, region):
+    #- Finite cylinder of axis p0-p1
+    p0 = np.asarray(region['p0'], dtype=float)
+    axis = np.asarray(region['p1'], dtype=float)-p0
+    axisLength2 = np.dot(axis, axis)
+    if axisLength2 == 0:
+        raise ValueError("Cylinder axis of zero length: {0}".format(region))
+    d = coord-p0
+    #- Axial position (fraction of axis length) and radial distance
+    s = np.dot(d, axis)/axisLength2
+    r2 = np.einsum('ij,ij->i', d, d)-s*s*axisLength2
+    return (s >= 0) & (s <= 1) & (r2 <= float(region['radius'])**2)
+
+regionTests = {'box': inBox, 'sphere': inSphere, 'cylinder': inCylinder}
+
+def inRegion(coord, region):
+    try:
+        test = regionTests[region['type']]
+    except KeyError:
+        raise KeyError("Unknown mask region type {0}, use one of {1}".format(
+                       region.get('type'), list(regionTests)))
+    return test(coord, region)
 
 # ---------------------------------------------------------------------------
 # SUBFUNCTION(S)
@@ -22,6 +78,9 @@ class spatialFilter():
         self.maskRegion = maskRegion
         self.fp = fp
 
+        #- Points tested per block (bounds the size of temporaries)
+        self.blockSize = 1<<20
+
     def maskPoints(self):
         #- Coordinates
         coordOutFILE = self.fp['coordOutFILE']
@@ -29,29 +88,36 @@ class spatialFilter():
             useInd = [1,2,3]
         elif coordOutFILE.endswith('.xy'):
             useInd = [0,1,2]
-        ptCloud = po.read_csv(coordOutFILE, 
-                          delim_whitespace=True, 
-                          header=None, 
-                          # names=['x', 'y', 'z'], 
-                          usecols=useInd).to_numpy()
-
-        #- Index of points to mask
-        self.maskInd = []
-        maskFilter = np.zeros((ptCloud.shape[0], ), dtype=bool)
-        offset = 0.005
-        minxyz = np.array(self.maskRegion['minBound'])+offset
-        maxxyz = np.array(self.maskRegion['maxBound'])+offset
-        for pind, p in enumerate(ptCloud):
-            if (p>=minxyz).all() and (p<=maxxyz).all():
-                self.maskInd.append(pind)
-                maskFilter[pind] = 1
+        ptCloud = po.read_csv(coordOutFILE,
+                          delim_whitespace=True,
+                          header=None,
+                          # names=['x', 'y', 'z'],
+                          usecols=useInd).to_numpy(dtype=float)
+
+        #- Points to mask
+        self.maskFilter = self.getMask(ptCloud)
+        self.maskInd = np.flatnonzero(self.maskFilter)
 
         #- Apply mask
-        self.coordMask = ptCloud[~maskFilter]
-        
+        self.coordMask = ptCloud[~self.maskFilter]
+
         # nptsMask = len(self.maskInd)
         # print('Points to mask: {0:d}'.format(nptsMask, ))
 
+    def getMask(self, coord):
+        #- Union of regions, less the difference regions
+        maskFilter = np.zeros((coord.shape[0], ), dtype=bool)
+        union = self.maskRegion.get('union', [])
+        difference = self.maskRegion.get('difference', [])
+        for i0 in range(0, coord.shape[0], self.blockSize):
+            block = coord[i0:i0+self.blockSize]
+            blockFilter = maskFilter[i0:i0+self.blockSize]
+            for region in union:
+                blockFilter |= inRegion(block, region)
+            for region in difference:
+                blockFilter &= ~inRegion(block, region)
+        return maskFilter
+
     def savedat(self):
         #- Precision and format of saved coordinates
         prec = '%.3f '
@@ -59,14 +125,14 @@ class spatialFilter():
 
         #- Save data
         coordMaskFILE = self.fp['coordMaskFILE']
-        np.savetxt(coordMaskFILE, self.coordMask, fmt=prec*ncoords) 
+        np.savetxt(coordMaskFILE, self.coordMask, fmt=prec*ncoords)
+        np.save(coordMaskFILE+'.npy', self.maskFilter)
         # print('Saved: {0:s}'.format(coordMaskFILE, ))
 
         #- Save masked index
         coordMaskIndFILE = self.fp['coordMaskIndFILE']
-        np.savetxt(coordMaskIndFILE, np.array(self.maskInd), fmt='%d')
-        # with open(coordMaskIndFILE, 'w') as f:
-        #     f.write('\n'.join(str(ind) for ind in self.maskInd))
+        np.savetxt(coordMaskIndFILE, self.maskInd, fmt='%d')
+        np.save(coordMaskIndFILE+'.npy', self.maskInd.astype(np.int64))
         # print('Saved: {0:s}'.format(coordMaskIndFILE, ))
 
         #- Save parameters
@@ -80,23 +146,35 @@ class spatialFilter():
 # ---------------------------------------------------------------------------
 def main():
     #- Parse arguments
+    parser = argparse.ArgumentParser(description='Generate mask points')
+    parser.add_argument('coordOutFILE', nargs='?',
+                        help='Coordinates file (.xy or .dat)')
+    parser.add_argument('coordMaskFILE', nargs='?',
+                        help='To export coordinates')
+    parser.add_argument('coordMaskIndFILE', nargs='?',
+                        help='To export indices')
+    parser.add_argument('-i', '--inputFILE', nargs='?',
+                        default='./preProcessing/userInput.json',
+                        help='Input file with the key `maskRegion`')
+    args = parser.parse_args()
     fp = {}
-    fp['coordOutFILE'] = sys.argv[1]
-    fp['coordMaskFILE'] = sys.argv[2] #- To export coordinates
-    fp['coordMaskIndFILE'] = sys.argv[3] #- To export indices
+    fp['coordOutFILE'] = args.coordOutFILE
+    fp['coordMaskFILE'] = args.coordMaskFILE
+    fp['coordMaskIndFILE'] = args.coordMaskIndFILE
 
-    #- Define region to mask (e.g. to exclude from POD calculation)
-    #- NOTE: Currently only accepts a box region with min-max bounds
-    maskRegion = {}
-    maskRegion['minBound'] = [400., 1065., 0.]
-    maskRegion['maxBound'] = [2800., 1935., 500.]
+    #- Region to mask (e.g. to exclude from POD calculation)
+    #- NOTE: Nothing is masked if the input has no `maskRegion`
+    with open(args.inputFILE) as f:
+        inputJSON = json.load(f)
+    maskRegion = inputJSON.get('maskRegion', {})
 
     p = spatialFilter(maskRegion, fp)
     p.maskPoints()
     p.savedat()
+    print('Masked points: {0:d} of {1:d}'.format(len(p.maskInd), len(p.maskFilter)))
 
 # ---------------------------------------------------------------------------
 # COMMAND LINE EXECUTION
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -29,8 +29,11 @@ coordRELPATH=system/sampling/pointCloud.dat
 # coordRELPATH=system/sampling/getBoundaryPoints/faceCenter.xy
 
 #- Flags
-#- Perform masking, uses python script
-maskFLAG=0
+#- Perform masking, uses python script (region `maskRegion` in $inputFILE)
+#- NOTE: Masked copies of the snapshots replace the links (assembleSnapshots.py -k)
+maskFLAG=1
+#- Path to python binary
+pythonPATH=${pythonPATH:-python}
 #- First pass of xy data file
 firstDataPassFLAG=1
 
@@ -69,6 +72,13 @@ for sampleRunDIR in "${arrSampleRuns[@]}"; do
     cp $coordInFILE $coordOutFILE
 done
 
+#- Get mask (boolean mask and index, text and binary .npy) and masked snapshots
+if [ $maskFLAG -eq 1 ]; then
+    $pythonPATH ${parentDIR}/preProcessing/assembleSnapshots.py -t $timeList \
+        -s $timeListSamples -o $snapsOutDIR -i $inputFILE -k \
+        -f "${arrFields[@]}"
+fi
+
 # #- OPTION 2: Copy snapshots to output time directory <run#.time> in `snapsOutDIR`
 # # conda init bash
 # # conda activate /gpfs/home/nkumar001/anaconda3/envs/sowfa
@@ -191,7 +201,7 @@ done
 #                     # echo "coordMaskFILE:" "$coordMaskFILE"
 #                     #- Get mask index
 #                     $pythonPATH ${parentDIR}/preProcessing/createMask.py \
-#                         $coordOutFILE $coordMaskFILE $coordMaskIndFILE
+#                         $coordOutFILE $coordMaskFILE $coordMaskIndFILE -i $inputFILE
 #                     #- Read mask index
 #                     # readarray -t maskInd < $coordMaskIndFILE
 #                 fi
@@ -225,19 +235,9 @@ done
 #                 done                
 #             fi
 #             #- Mask lines
-#             if [ $maskFLAG -eq 1 ]; then
-#                 #- OPTION 1: Fails with 'too many arguments'
-#                 # sed -i ''"${maskInd[*]/%/d;}"'' $snapOutFILE
-#                 #- OPTION 2: Painfully slow
-#                 # for lineN in "${maskInd[@]}"; do
-#                 #     sed -i "${lineN}d" $snapOutFILE
-#                 # done
-#                 #- OPTION 3
-#                 #- SEE: https://stackoverflow.com/a/26727351/7473705
-#                 awk 'NR==FNR {del[$1]; next} !(FNR in del)' \
-#                     $coordMaskIndFILE $snapOutFILE > ${snapOutFILE}.tmp \
-#                     && mv ${snapOutFILE}.tmp $snapOutFILE
-#             fi
+#             #- NOTE: Snapshots are no longer rewritten; the mask ${coordMaskFILE}.npy
+#             #-       is applied when the snapshots are read, see
+#             #-       removeForcingField.py -k and utils/snapshotStore.py -m
 #             firstDataPassFLAG=0
 #         done
 #     done
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Create time list in given range of snapshots and time step
+    Python version of createTimeList.sh: times of the first sample directory
+    are compared as numbers (see utils/timeCatalogue.py), and the directory
+    listing is cached between runs.
+RUN:
+    $ python createTimeList.py $timeList $timeListSamples [init|predict|predictOT]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils'))
+from timeCatalogue import timeCatalogue
+
+# ---------------------------------------------------------------------------
+# MAIN FUNCTION
+# ---------------------------------------------------------------------------
+def main():
+    #- Read arguments
+    CLI = argparse.ArgumentParser(description='Create time list')
+    CLI.add_argument('timeList',
+                    help="Output list of time steps",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('timeListSamples',
+                    help="Output list of <run>.<time> snapshots",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('runType',
+                    help="Stage of run: basis generation or predict (optional)",
+                    nargs='?',
+                    type=str,
+                    default='init')
+    args = CLI.parse_args()
+
+    #- Input file
+    if args.runType == "init":
+        inputFILE = "./preProcessing/userInput.json"
+    elif args.runType in ["predict", "predictOT"]:
+        inputFILE = "./postProcessing/userInput.predict.json"
+    with open(inputFILE) as f:
+        inputJSON = json.load(f)
+    snapTimes = inputJSON['snapTimes']
+    sampleDIRS = inputJSON['sampleDirectories']
+    snapsDIR0 = os.path.join(sampleDIRS[0], 'postProcessing', 'internalField')
+    # snapsDIR0 = os.path.join(sampleDIRS[0], 'postProcessing', 'boundaryField')
+
+    #- Logging
+    print("\n")
+    print("####### createTimeList ######")
+    print("tStart:", snapTimes['tStart'])
+    print("tEnd:", snapTimes['tEnd'])
+    print("nSkip:", snapTimes['nSkip'])
+    print("timeList:", args.timeList)
+
+    #- Times in range
+    catalogue = timeCatalogue(snapsDIR0)
+    timeNames = catalogue.select(snapTimes['tStart'], snapTimes['tEnd'], snapTimes['nSkip'])
+    assert len(timeNames) > 0, \
+           f"No times in [{snapTimes['tStart']}, {snapTimes['tEnd']}] in {snapsDIR0}"
+    print("nt:", len(timeNames), "(cached)" if catalogue.isCached else "")
+
+    #- Write list of times, and of times <run#.time>
+    with open(args.timeList, 'w') as f:
+        f.write(''.join(t+'\n' for t in timeNames))
+    with open(args.timeListSamples, 'w') as f:
+        for cnt in range(1, len(sampleDIRS)+1):
+            f.write(''.join('{0}.{1}\n'.format(cnt, t) for t in timeNames))
+
+# ---------------------------------------------------------------------------
+# COMMAND LINE EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,17 @@ import os
 import shutil
 import glob
 import json
+import queue
 from pathlib import Path
 from mpi4py import MPI
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils'))
+from snapshotStore import snapshotReader, loadMask
+from snapshotPrefetch import snapshotPrefetcher
+from backgroundWriter import backgroundWriter
+from taskScheduler import taskScheduler
+
 comm = MPI.COMM_WORLD
 MPI_RANK = comm.Get_rank()
 MPI_SIZE = comm.Get_size()
@@ -35,12 +43,23 @@ def make_dir(dirPATH):
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class getForcingField():
-    def __init__(self, fieldNAME, timeList, sampleDIR, outDIR, runType):
-        self.fieldNAME = fieldNAME
+    def __init__(self, fieldNames, timeList, sampleDIR, outDIR, runType, mode='memory', 
+                 maskFILE=None):
+        #- NOTE: The geometry of the sample directory is shared by all fields
+        self.fieldNames = fieldNames
         self.timeList = timeList
         self.sampleDIR = sampleDIR
         self.outDIR = outDIR
         self.runType = runType
+        self.mode = mode
+
+        #- Number of snapshots read ahead or waiting to be written
+        self.ioDepth = 2
+
+        #- Points kept in the saved snapshots (all if no mask)
+        #- NOTE: The forcing field is computed on all points
+        self.maskFILE = maskFILE
+        self.nPtsMask, self.keepInd = loadMask(maskFILE) if maskFILE else (None, None)
 
         #- Read input 
         if self.runType == "init":
@@ -56,6 +75,10 @@ class getForcingField():
         #- Run index (starts from 1)
         self.runINDEX = inputJSON['sampleDirectories'].index(self.sampleDIR)+1
 
+        #- Snapshots (time directories or snapshot store)
+        self.snapReader = snapshotReader(os.path.join(self.sampleDIR, 
+                                         'postProcessing', 'internalField'))
+
         #- Variable types
         self.scaList=["p", "p_rgh", "T", "Tprime", "k", "kSGS", "kSGSmean", 
                       "kappat", "nuSgs", "nuSGSmean", "nut", "omega"]
@@ -73,19 +96,28 @@ class getForcingField():
         elif [True if f.endswith('.dat') else False for f in coordFILEList][0]:
             coordFILE = [f if f.endswith('.dat') else None for f in coordFILEList][0]
             useInd = [1,2,3]
-        assert coordFILE != None, f"Coordinate file not found!"
+        assert coordFILE != None, "Coordinate file not found!"
         self.allCoord = po.read_csv(coordFILE, 
                           delim_whitespace=True, 
                           header=None, 
                           names=['x', 'y', 'z'], 
                           usecols=useInd).to_numpy()
         self.nAllCoord = len(self.allCoord)
+        assert self.keepInd is None or self.nPtsMask==self.nAllCoord, \
+               f"Mask {self.maskFILE} has {self.nPtsMask} points, {coordFILE} has {self.nAllCoord}"
         #- Copy coordinates file
         coordFILEBaseName = os.path.basename(coordFILE)
         coordFILEOut = os.path.join(self.outDIR, coordFILEBaseName)
         if not os.path.isfile(coordFILEOut):
             make_dir(self.outDIR)
-            shutil.copy2(coordFILE, coordFILEOut)
+            if self.keepInd is None:
+                shutil.copy2(coordFILE, coordFILEOut)
+            else:
+                #- Lines of the points kept
+                with open(coordFILE) as f:
+                    lines = f.readlines()
+                with open(coordFILEOut, 'w') as f:
+                    f.writelines([lines[i] for i in self.keepInd])
 
         #- Bounding domain index
         self.boundInd = np.empty(self.nAllCoord)
@@ -98,138 +130,188 @@ class getForcingField():
         comm.Bcast([self.boundInd, MPI.DOUBLE], root=0)
         self.boundInd = self.boundInd.astype(bool)
 
+        #- Group z-coordinates for each unique (x,y) locations
+        zAllOffsets, zAllInd = self._groupZCoord(self.allCoord)
+        self.nzAll = zAllOffsets[1]
+        self.zAllLevel = self._zLevel(zAllOffsets, zAllInd)
+        #-
+        self.boundCoord = self.allCoord[self.boundInd]
+        zBoundOffsets, self.zBoundInd = self._groupZCoord(self.boundCoord)
+        self.nzBound = zBoundOffsets[1]
+        self.nxyUniqueBound = len(zBoundOffsets)-1
+        self.zBoundLevel = self._zLevel(zBoundOffsets, self.zBoundInd)
+        assert self.nzAll==self.nzBound, \
+               f"Profile length mismatch: All={self.nzAll}, Bound={self.nzBound}"
+        assert np.all(np.diff(zBoundOffsets)==self.nzBound), \
+               "Profile length differs between (x,y) locations"
+
     def scatterTime(self):
         self.ts = po.read_csv(self.timeList, 
                           delim_whitespace=True, 
                           header=None).to_numpy().flatten()
         self.ts = [int(float(t)) if int(float(t))==float(t) else float(t) for t in self.ts]
         self.nt = len(self.ts)
-        self.timeIndPerRank = None
-        if MPI_RANK == 0:
-            #- Determine the size of each sub-task
-            v, res = divmod(self.nt, MPI_SIZE)
-            taskSizePerRank = [v+1 if p<res else v for p in range(MPI_SIZE)]
-            #- Determine starting and ending indices of each sub-task
-            startIndPerTask = [sum(taskSizePerRank[:p]) for p in range(MPI_SIZE)]
-            endIndPerTask = [sum(taskSizePerRank[:p+1]) for p in range(MPI_SIZE)] 
-            #- Split full time list into sub-list
-            timeInd = np.arange(self.nt).tolist()
-            self.timeIndPerRank = [timeInd[startIndPerTask[p]:endIndPerTask[p]] \
-                                    for p in range(MPI_SIZE)]
-        self.timeIndPerRank = comm.scatter(self.timeIndPerRank, root=0)
+        #- NOTE: Time steps are handed out to the ranks in chunks while they are
+        #-       read (see _readSnapshots)
 
     def getMeanProfile(self):
         #- Column index/indices in the snapshot file to use
-        fld = self.fieldNAME
-        self.nv = 0
-        if fld in self.scaList:
-            self.nv = 1
-        if fld in self.vecList:
-            self.nv = 3
-        if fld in self.tenList:
-            self.nv = 6
-        assert self.nv>0, f"Field size not assigned!"
-        
-        #- Group z-coordinates for each unique (x,y) locations
-        self.zAllIndList = self._groupZCoord(self.allCoord)
-        self.nzAll = len(self.zAllIndList[0])
-        #-
-        boundCoord = self.allCoord[self.boundInd.astype(bool)]
-        zBoundIndList = self._groupZCoord(boundCoord)
-        nzBound = len(zBoundIndList[0])
-        nxyUniqueBound = len(zBoundIndList)
-        assert self.nzAll==nzBound, \
-               f"Profile length mismatch: All={self.nzAll}, Bound={nzBound}"
+        self.nv = {}
+        for fld in self.fieldNames:
+            self.nv[fld] = 0
+            if fld in self.scaList:
+                self.nv[fld] = 1
+            if fld in self.vecList:
+                self.nv[fld] = 3
+            if fld in self.tenList:
+                self.nv[fld] = 6
+            assert self.nv[fld]>0, f"Field size not assigned for {fld}!"
+        nzBound = self.nzBound
         
         #- Paths
         forcingFieldDIR = os.path.join(self.outDIR, 'forcingField')
         make_dir(forcingFieldDIR)
 
-        #- Number of time steps in the current rank
-        self.ntPerRank = len(self.timeIndPerRank)
-        
         #- Get profiles
-        npvAll = self.nAllCoord*self.nv
-        self.snapAllPerRank = np.zeros((self.ntPerRank, npvAll))
-        boundZSnapSum = np.zeros(nzBound*self.nv)
-        for i in range(self.ntPerRank):
-            snapFILE = os.path.join(self.sampleDIR, 
-                        'postProcessing', 'internalField', 
-                        str(self.ts[self.timeIndPerRank[i]]),
-                        'cloud_'+fld+'.xy')
-            allField = po.read_csv(snapFILE, 
-                                   header=None, 
-                                   delimiter="\t").to_numpy()
-            self.snapAllPerRank[i,:] = allField.reshape(npvAll)
-            #- Get rank-wise sum of profiles
-            if self.runType == "predict":
-                boundField = allField[self.boundInd, :]
-                #- Sum and mean over all unique (x,y) location
-                for j in range(nxyUniqueBound):
-                    zInd = zBoundIndList[j]
-                    boundZSnapSum += boundField[zInd,:].reshape(nzBound*self.nv)
+        #- NOTE: In stream mode the snapshots are not kept, they are read again
+        #-       by removeForcingField (second pass)
+        if self.mode == "memory":
+            self.timeIndPerRank = []
+            self.snapAllPerRank = {fld: [] for fld in self.fieldNames}
+        boundZSnapSum = {fld: np.zeros(nzBound*self.nv[fld]) for fld in self.fieldNames}
+        if self.mode == "stream" and self.runType != "predict":
+            snapshots = []
+        else:
+            snapshots = self._readSnapshots(self.sampleDIR+' (read)')
+        for j, allFields in snapshots:
+            if self.mode == "memory":
+                self.timeIndPerRank.append(j)
+            for fld in self.fieldNames:
+                allField = allFields[fld]
+                if self.mode == "memory":
+                    self.snapAllPerRank[fld].append(allField)
+                #- Get rank-wise sum of profiles
+                if self.runType == "predict":
+                    boundField = allField[self.boundInd, :]
+                    #- Sum and mean over all unique (x,y) location
+                    #- NOTE: Accumulated in place, column by column
+                    np.add.at(boundZSnapSum[fld].reshape((nzBound, self.nv[fld])), 
+                              self.zBoundLevel[self.zBoundInd], boundField[self.zBoundInd, :])
 
         #- Calculate or get forcing field based on runType
-        if self.runType == "predict":
-            #- Get mean over all unique (x,y) locations
-            self.boundZSnapMean = boundZSnapSum/nxyUniqueBound
-            
-            #- Get mean over all time
-            #- NOTE: The rank-specific variables boundZSnapSum and boundZSnapMean 
-            #-       are reused to represent their counterparts over all ranks.
-            comm.Barrier()
-            boundZSnapSum = np.zeros(nzBound*self.nv)
-            comm.Allreduce(self.boundZSnapMean, boundZSnapSum, op=MPI.SUM)
-            if MPI_RANK == 0:
-                self.boundZSnapMean = boundZSnapSum/self.nt
-            comm.Bcast([self.boundZSnapMean, MPI.DOUBLE], root=0)
-            
-            #- Reshape
-            self.boundZSnapMean = self.boundZSnapMean.reshape((nzBound, self.nv))
-            
-            #- Save mean profile
-            outMeanFILE = os.path.join(forcingFieldDIR, 
-                                       str(self.runINDEX)+'.ff_'+self.fieldNAME+'.xy')
-            np.savetxt(outMeanFILE, self.boundZSnapMean, fmt='%g', delimiter='\t')
+        self.boundZSnapMean = {}
+        for fld in self.fieldNames:
+            if self.runType == "predict":
+                #- Get mean over all unique (x,y) locations
+                boundZSnapMean = boundZSnapSum[fld]/self.nxyUniqueBound
+                
+                #- Get mean over all time
+                #- NOTE: The rank-specific variables boundZSnapSum and boundZSnapMean 
+                #-       are reused to represent their counterparts over all ranks.
+                comm.Barrier()
+                boundZSnapSum[fld] = np.zeros(nzBound*self.nv[fld])
+                comm.Allreduce(boundZSnapMean, boundZSnapSum[fld], op=MPI.SUM)
+                if MPI_RANK == 0:
+                    boundZSnapMean = boundZSnapSum[fld]/self.nt
+                comm.Bcast([boundZSnapMean, MPI.DOUBLE], root=0)
+                
+                #- Reshape
+                self.boundZSnapMean[fld] = boundZSnapMean.reshape((nzBound, self.nv[fld]))
+                
+                #- Save mean profile
+                outMeanFILE = os.path.join(forcingFieldDIR, 
+                                           str(self.runINDEX)+'.ff_'+fld+'.xy')
+                np.savetxt(outMeanFILE, self.boundZSnapMean[fld], fmt='%g', delimiter='\t')
+
+            elif self.runType == "predictOT":
+                meanOTProfileFILE = os.path.join(forcingFieldDIR, 
+                                       str(self.runINDEX)+'.ff_'+fld+'.xy')
+                self.boundZSnapMean[fld] = po.read_csv(meanOTProfileFILE, 
+                                           header=None, 
+                                           delimiter="\t").to_numpy()
 
-            #- Save zCoord
-            zBoundCoord = boundCoord[zBoundIndList[0],2]
+        #- Save zCoord
+        if self.runType == "predict":
+            zBoundCoord = self.boundCoord[self.zBoundInd[:nzBound],2]
             outFILE = os.path.join(forcingFieldDIR, 'zCoordBound.xy')
             if not Path(outFILE).is_file():
                 np.savetxt(outFILE, zBoundCoord, fmt='%g', delimiter='\t')
 
-        elif self.runType == "predictOT":
-            meanOTProfileFILE = os.path.join(forcingFieldDIR, 
-                                   str(self.runINDEX)+'.ff_'+self.fieldNAME+'.xy')
-            self.boundZSnapMean = po.read_csv(meanOTProfileFILE, 
-                                       header=None, 
-                                       delimiter="\t").to_numpy()
-
     def removeForcingField(self):
-        nxyUniqueAll = len(self.zAllIndList)
-        for i in range(self.ntPerRank):
-            #- Calculate fluctuation
-            fluctAllField = self.snapAllPerRank[i,:].reshape((self.nAllCoord, self.nv))
-            for j in range(nxyUniqueAll):
-                zInd = self.zAllIndList[j]
-                fluctAllField[zInd,:] -= self.boundZSnapMean
-            #- Save fluctuating field
-            ti = str(self.runINDEX)+'.'+str(self.ts[self.timeIndPerRank[i]])
-            outDIR = os.path.join(self.outDIR, ti)
-            make_dir(outDIR)
-            outFILE = os.path.join(outDIR, 'cloud_'+self.fieldNAME+'.xy')
-            np.savetxt(outFILE, fluctAllField, fmt='%g', delimiter='\t')
+        #- Save in a background thread
+        writer = backgroundWriter(self._saveFluct, self.ioDepth)
+        if self.mode == "memory":
+            for i, j in enumerate(self.timeIndPerRank):
+                for fld in self.fieldNames:
+                    #- Calculate fluctuation
+                    allField = self.snapAllPerRank[fld][i]
+                    self.snapAllPerRank[fld][i] = None
+                    fluctAllField = self._subtract(allField, fld)
+                    writer.put(self.ts[j], fld, fluctAllField)
+        else:
+            #- Read, subtract and write one snapshot at a time
+            for j, allFields in self._readSnapshots(self.sampleDIR+' (remove)'):
+                for fld in self.fieldNames:
+                    fluctAllField = self._subtract(allFields[fld], fld)
+                    writer.put(self.ts[j], fld, fluctAllField)
+        writer.close()
+
+    def _subtract(self, allField, fld):
+        #- Fluctuation at the points kept (masked points are dropped here, no
+        #- masked copy of the snapshots is written)
+        if self.keepInd is None:
+            return allField-self.boundZSnapMean[fld][self.zAllLevel, :]
+        return allField[self.keepInd]-self.boundZSnapMean[fld][self.zAllLevel[self.keepInd], :]
+
+    def _saveFluct(self, t, fld, fluctAllField):
+        #- Save fluctuating field
+        ti = str(self.runINDEX)+'.'+str(t)
+        outDIR = os.path.join(self.outDIR, ti)
+        make_dir(outDIR)
+        outFILE = os.path.join(outDIR, 'cloud_'+fld+'.xy')
+        np.savetxt(outFILE, fluctAllField, fmt='%g', delimiter='\t')
+
+    def _readSnapshots(self, label):
+        #- Time index and snapshot {field: values} of the time steps claimed by
+        #- the current rank, read ahead in a background thread; a multi-field 
+        #- cloud file is read once per time
+        #- NOTE: Collective (scheduler). Chunks are claimed here, one ahead, and
+        #-       their times passed on to the reader thread, which makes no MPI calls.
+        scheduler = taskScheduler(comm, self.nt)
+        chunks = scheduler.chunks()
+        feed = queue.Queue()
+        reader = snapshotPrefetcher(lambda t: self.snapReader.readFields(str(t), self.fieldNames), 
+                                    self.ioDepth)
+        reader.start(iter(feed.get, None))
+        try:
+            chunk = next(chunks, None)
+            while chunk is not None:
+                for j in range(*chunk):
+                    feed.put(self.ts[j])
+                nextChunk = next(chunks, None)
+                if nextChunk is None:
+                    feed.put(None)
+                for j in range(*chunk):
+                    yield j, reader.get(self.ts[j])
+                chunk = nextChunk
+        finally:
+            feed.put(None)
+            reader.stop()
+        scheduler.report(label)
 
     def _groupZCoord(self, coord):
-        #- Get unique (x,y) locations
-        xyUniqueInd = np.unique(coord[:,[0, 1]], axis=0, return_index=True)[1]
-        xyUnique = coord[xyUniqueInd, :2]
-        nxyUnique = len(xyUniqueInd)
-        #- Get indices of all points grouped by the (x,y) locations
-        zIndList = []
-        for i in range(nxyUnique):
-            zIndList += [np.where(np.all(coord[:,:2]==xyUnique[i], axis=1))[0], ]
-        return zIndList
+        #- Group the points by unique (x,y) locations (sorted), in CSR form:
+        #- column j holds the points indices[offsets[j]:offsets[j+1]], in file order
+        xyInv = np.unique(coord[:,[0, 1]], axis=0, return_inverse=True)[1].ravel()
+        indices = np.argsort(xyInv, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(xyInv))))
+        return offsets, indices
+
+    def _zLevel(self, offsets, indices):
+        #- Position of each point within its column (index in the profile)
+        zLevel = np.empty(len(indices), dtype=int)
+        zLevel[indices] = np.arange(len(indices))-np.repeat(offsets[:-1], np.diff(offsets))
+        return zLevel
 
 # ---------------------------------------------------------------------------
 # MAIN FUNCTION
@@ -238,17 +320,17 @@ def main():
     #- Read arguments
     CLI = argparse.ArgumentParser(description='Compare field values')
     CLI.add_argument('-f', '--fieldNAME', 
-                    help="Field name", 
-                    nargs='?', # '*'
+                    help="Field name(s)", 
+                    nargs='*',
                     type=str,
-                    default='U')
+                    default=['U'])
     CLI.add_argument('-t', '--timeList', 
                     help="List of time steps", 
                     nargs='?',
                     type=str)
     CLI.add_argument('-s', '--sampleDIR', 
-                    help="Input sample directory to read snapshots", 
-                    nargs='?', 
+                    help="Input sample directory/directories to read snapshots", 
+                    nargs='*', 
                     type=str)
     CLI.add_argument('-o', '--outDIR', 
                     help="Output directory to store snapshots", 
@@ -259,6 +341,17 @@ def main():
                     nargs='?', 
                     type=str,
                     default='init')
+    CLI.add_argument('-m', '--mode', 
+                    help="Keep the snapshots in memory, or read them twice (bounded memory)", 
+                    nargs='?', 
+                    type=str,
+                    choices=['memory', 'stream'],
+                    default='memory')
+    CLI.add_argument('-k', '--maskFILE', 
+                    help="Boolean mask (.npy) of points to drop from the saved snapshots, "
+                         "from createMask.py (optional)", 
+                    nargs='?', 
+                    type=str)
 
     try:
         args = CLI.parse_args()
@@ -266,16 +359,20 @@ def main():
         print("Check inputs")
         quit()
 
-    p = getForcingField(args.fieldNAME,
-                        args.timeList,
-                        args.sampleDIR,
-                        args.outDIR,
-                        args.runType)
+    #- All fields of a sample directory are processed together
+    for sampleDIR in args.sampleDIR:
+        p = getForcingField(args.fieldNAME,
+                            args.timeList,
+                            sampleDIR,
+                            args.outDIR,
+                            args.runType,
+                            args.mode,
+                            args.maskFILE)
 
-    p.getInflowDomain()
-    p.scatterTime()
-    p.getMeanProfile()
-    p.removeForcingField()
+        p.getInflowDomain()
+        p.scatterTime()
+        p.getMeanProfile()
+        p.removeForcingField()
 
 # ---------------------------------------------------------------------------
 # COMMAND LINE EXECUTION
@@ -12,8 +12,12 @@ from __future__ import division, print_function
 import numpy as np
 import pandas as po
 import scipy.linalg as la
+from scipy.spatial import cKDTree
+import hashlib
 import os
 import argparse
+import sys
+import itertools
 from pathlib import Path
 # import h5py
 
@@ -22,6 +26,13 @@ from precice import action_write_initial_data, \
                     action_read_iteration_checkpoint, \
                     action_write_iteration_checkpoint
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils'))
+from snapshotStore import snapshotReader
+from podBasis import podBasis
+from snapshotPrefetch import snapshotPrefetcher
+from chronosLog import chronosWriter
+
 # ---------------------------------------------------------------------------
 # UTILITY FUNCTION(S)
 # ---------------------------------------------------------------------------
@@ -35,6 +46,21 @@ def loadSerialCSV(fileID):
                                   header=None, 
                                   delim_whitespace=True).to_numpy())
 
+def loadSnapshot(snapReader, t):
+    #- Read fields at time t (time directories or snapshot store)
+    snapTime = '{0:.12g}'.format(t)
+    return [snapReader.read(snapTime, fld) for fld in fieldNames]
+
+def copySnapshot(snapshot, out):
+    #- Copy fields into the buffers `out`
+    #- NOTE: Vector components are stacked, [x(0..nPts-1), y(0..nPts-1), ...]
+    for value, buf in zip(snapshot, out):
+        buf.reshape((value.shape[1], -1))[:] = value.T
+
+def snapTimes(t0, dt, i0):
+    #- Snapshot times t0 + i*dt, i = i0, i0+1, ...
+    return (t0 + i*dt for i in itertools.count(i0))
+
 def saveCoeff(t, coeffs):
     aPressure = coeffs[0]
     aVelocity = coeffs[1]
@@ -61,37 +87,73 @@ def saveCoeff(t, coeffs):
 # ---------------------------------------------------------------------------
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
-def solveMin(A, b):
-    #- Compute a vector x such that the 2-norm |b - Ax| is minimized
-    #- Returns: x (and residues b - Ax, rank of A, singular values of A)
-    x, _, _, _ = la.lstsq(A, b, 
-                        cond=None, 
-                        overwrite_a=False, 
-                        overwrite_b=False, 
-                        check_finite=True, 
-                        lapack_driver=None)
-    return x
-
-def locateOverlap(overlapgrid, lfgrid):
+class podProjector():
+    #- Least-squares projection of several fields, each onto its own fixed modes
+    #- NOTE: Factorized once; minimizing |b - Ax| then costs one mat-vec x = A^+ b.
+    #-       Fields of equal size are stacked and handled by one batched matmul,
+    #-       reading and writing preallocated buffers reused at every step.
+    def __init__(self, modes):
+        #- Group fields by basis shape
+        shapes = [m.shape for m in modes]
+        self.groups = []
+        for shape in dict.fromkeys(shapes):
+            ind = [i for i, s in enumerate(shapes) if s == shape]
+            nG = len(ind)
+            self.groups.append({'ind': ind,
+                                'modes': np.stack([modes[i] for i in ind]),
+                                'pinv': np.stack([la.pinv(modes[i]) for i in ind]),
+                                'field': np.zeros((nG, shape[0], 1)),
+                                'coeff': np.zeros((nG, shape[1], 1)),
+                                'pred': np.zeros((nG, shape[0], 1))})
+
+        #- Views of the buffers per field, in the order of `modes`
+        self.field = [None]*len(modes)
+        self.coeff = [None]*len(modes)
+        self.pred = [None]*len(modes)
+        for grp in self.groups:
+            for j, i in enumerate(grp['ind']):
+                self.field[i] = grp['field'][j, :, 0]
+                self.coeff[i] = grp['coeff'][j, :, 0]
+                self.pred[i] = grp['pred'][j, :, 0]
+
+    def project(self):
+        #- Coefficients of the fields in `self.field`
+        for grp in self.groups:
+            np.matmul(grp['pinv'], grp['field'], out=grp['coeff'])
+
+    def reconstruct(self):
+        #- Fields from the coefficients in `self.coeff`
+        for grp in self.groups:
+            np.matmul(grp['modes'], grp['coeff'], out=grp['pred'])
+
+def locateOverlap(overlapgrid, lfgrid, tol, cacheDIR='.'):
     #- Return index in lfgrid that corresponds to overlapgrid, in same order
-    #- Round to remove effect of offset (~0.001)
-    overlapgrid = overlapgrid.round(decimals=2)
-    lfgrid = lfgrid.round(decimals=2)
+    #- NOTE: Nearest LF node within distance `tol` (absorbs the offset ~0.001).
+    #-       The result is cached, keyed by the hashes of both grids.
+    key = hashlib.sha1(repr(tol).encode())
+    for grid in [overlapgrid, lfgrid]:
+        key.update(np.ascontiguousarray(grid, dtype=float).tobytes())
+    cacheFILE = os.path.join(cacheDIR, '.overlap.'+key.hexdigest()+'.npy')
+    if os.path.isfile(cacheFILE):
+        return np.load(cacheFILE)
+
     #- Locate indices
-    indOverlap = []
-    for p in overlapgrid:
-        if (p==lfgrid).all(axis=1).any():
-            indOverlap.append(np.where((p==lfgrid).all(axis=1))[0][0])
-        else:
-            print("WARNING: Overlap node ", p, " not found in LF mesh")
-            indOverlap.append(None)
-    #- Indices of stacked vector array
-    lfnPts = lfgrid.shape[0]
-    indOverlapVec = []
-    for i in range(3):
-        for ind in indOverlap:
-            indOverlapVec.append(ind+i*lfnPts)
-    return indOverlap, indOverlapVec
+    dist, indOverlap = cKDTree(lfgrid).query(overlapgrid, distance_upper_bound=tol)
+    unmatched = np.flatnonzero(np.isinf(dist))
+    if len(unmatched) > 0:
+        for i in unmatched[:10]:
+            print("WARNING: Overlap node ", overlapgrid[i], " not found in LF mesh")
+        raise ValueError("{0} of {1} overlap nodes not found in LF mesh (tol={2})".format(
+                         len(unmatched), len(overlapgrid), tol))
+
+    #- Write to a temporary file first so that other runs never see a partial map
+    tmpFILE = cacheFILE+'.tmp.npy'
+    try:
+        np.save(tmpFILE, indOverlap)
+        os.replace(tmpFILE, cacheFILE)
+    except OSError:
+        print("WARNING: Could not save overlap map {0}".format(cacheFILE))
+    return indOverlap
 
 # ---------------------------------------------------------------------------
 # INPUT
@@ -106,6 +168,27 @@ parser.add_argument('-p', '--parentDIR',
                     help="Location where the code is launched.", 
                     nargs='?', 
                     type=str)
+parser.add_argument('-t', '--tolerance', 
+                    help="Distance tolerance to match overlap and LF nodes.", 
+                    nargs='?', 
+                    type=float,
+                    default=5e-3)
+parser.add_argument('-d', '--prefetchDepth', 
+                    help="Number of snapshots read ahead of the coupling loop.", 
+                    nargs='?', 
+                    type=int,
+                    default=4)
+parser.add_argument('-o', '--outFormat', 
+                    help="Coefficient output: appendable binary log or text files per time step.", 
+                    nargs='?', 
+                    type=str,
+                    choices=['log', 'text'],
+                    default='log')
+parser.add_argument('-n', '--flushEvery', 
+                    help="Number of time steps between writes of the coefficient log.", 
+                    nargs='?', 
+                    type=int,
+                    default=100)
 
 try:
     args = parser.parse_args()
@@ -114,6 +197,8 @@ except SystemExit:
     quit()
 
 nModes = 6
+fieldNames = ['p', 'U', 'k', 'omega', 'nut']
+fieldSizes = {'p': 1, 'U': 3, 'k': 1, 'omega': 1, 'nut': 1}
 tStart = 100
 dtSnap = 0.001 # 0.005
 dt = dtSnap
@@ -136,50 +221,44 @@ interface = precice.Interface("lf",
 dimensions = interface.get_dimensions()
 
 #- Read snapshots and coordinates data
+#- NOTE: A snapshot store <fieldDIR>.store is used if present
 fieldDIR = os.path.join(snapsPATH,'postProcessing','internalField')
 # fieldDIR = os.path.join(snapsPATH,'postProcessing','boundaryField')
+snapReader = snapshotReader(fieldDIR)
+#- Read the next snapshots in a background thread
+prefetch = snapshotPrefetcher(lambda t: loadSnapshot(snapReader, t), args.prefetchDepth)
 
 #- Read overlap mesh
-snapTimeDIR = os.path.join(fieldDIR, '{0:.12g}'.format(tStart))
-snapData = loadSerialCSV(os.path.join(snapTimeDIR, 'cloud_p_k_omega_nut.xy'))
-#-
-overlapgrid = snapData[:, :3]
+overlapgrid = snapReader.readCoord('{0:.12g}'.format(tStart))
 overlapnPts = overlapgrid.shape[0]
 #- Locate overlap domain
 lfgrid = loadSerialCSV(lfmeshFILE)
 lfnPts = lfgrid.shape[0]
-indOverlap, indOverlapVec = locateOverlap(overlapgrid, lfgrid)
-
-#- Read field at t=0
-pressure = snapData[:, 3]
-tke = snapData[:, 4]
-omega = snapData[:, 5]
-nut = snapData[:, 6]
-#-
-snapData = loadSerialCSV(os.path.join(snapTimeDIR, 'cloud_U.xy'))
-velocity = snapData[:, 3:]
-#-
-# pressure = pressure[:, None]
-velocity = velocity.reshape((overlapnPts*3, 1), order='F')
+indOverlap = locateOverlap(overlapgrid, lfgrid, args.tolerance)
 
 #- Read POD data
-modePressure = np.fromfile(os.path.join(podPATH, 'modes.p', 'mode.bin'), dtype=float)
-modeVelocity = np.fromfile(os.path.join(podPATH, 'modes.U', 'mode.bin'), dtype=float)
-modeTKE = np.fromfile(os.path.join(podPATH, 'modes.k', 'mode.bin'), dtype=float)
-modeOmega = np.fromfile(os.path.join(podPATH, 'modes.omega', 'mode.bin'), dtype=float)
-modeNut = np.fromfile(os.path.join(podPATH, 'modes.nut', 'mode.bin'), dtype=float)
-#- 
-modePressure = modePressure.reshape((nModes, lfnPts*1)).T
-modeVelocity = modeVelocity.reshape((nModes, lfnPts*3)).T
-modeTKE = modeTKE.reshape((nModes, lfnPts*1)).T
-modeOmega = modeOmega.reshape((nModes, lfnPts*1)).T
-modeNut = modeNut.reshape((nModes, lfnPts*1)).T
-#- 
-modePressure = modePressure[indOverlap,:]
-modeVelocity = modeVelocity[indOverlapVec,:]
-modeTKE = modeTKE[indOverlap,:]
-modeOmega = modeOmega[indOverlap,:]
-modeNut = modeNut[indOverlap,:]
+#- NOTE: Memory-mapped, only the modes at the overlap points are loaded
+modes = [podBasis(os.path.join(podPATH, 'modes.'+fld), lfnPts, fieldSizes[fld]).matrix((0, nModes), indOverlap)
+         for fld in fieldNames]
+#- Projector of the overlap modes (fixed during the run)
+projector = podProjector(modes)
+#- Predicted fields written to preCICE (views of the projector buffers)
+predPressure = projector.pred[0]
+predVelocity = projector.pred[1].reshape((3, overlapnPts)).T
+predTKE = projector.pred[2]
+predOmega = projector.pred[3]
+predNut = projector.pred[4]
+
+#- Coefficient output
+if args.outFormat == 'log':
+    chronosLog = chronosWriter(os.path.join('.','chronos'), fieldNames, nModes, args.flushEvery)
+    writeCoeff = chronosLog.append
+else:
+    writeCoeff = saveCoeff
+
+#- Read field at t=0
+prefetch.start(snapTimes(tStart, dt, 0))
+copySnapshot(prefetch.get(tStart), projector.field)
 
 #- Mesh information
 lfmeshID = interface.get_mesh_id("lf-Mesh")
@@ -203,24 +282,9 @@ if interface.is_read_data_available():
 
 if interface.is_action_required(action_write_initial_data()):
     #- Calculate coefficient at t=0
-    aPressure = solveMin(modePressure.T@modePressure, modePressure.T@pressure)
-    aVelocity = solveMin(modeVelocity.T@modeVelocity, modeVelocity.T@velocity)
-    aTKE = solveMin(modeTKE.T@modeTKE, modeTKE.T@tke)
-    aOmega = solveMin(modeOmega.T@modeOmega, modeOmega.T@omega)
-    aNut = solveMin(modeNut.T@modeNut, modeNut.T@nut)
-    saveCoeff(t, [aPressure, aVelocity, aTKE, aOmega, aNut])
-
-    predPressure = modePressure@aPressure #- .T + modePressure[:, 0, None]
-    predVelocity = modeVelocity@aVelocity #- .T + modeVelocity[:, 0, None]
-    predTKE = modeTKE@aTKE #- .T + modeTKE[:, 0, None]
-    predOmega = modeOmega@aOmega #- .T + modeOmega[:, 0, None]
-    predNut = modeNut@aNut #- .T + modeNut[:, 0, None]
-    #-
-    predPressure = predPressure.squeeze()
-    predVelocity = predVelocity.reshape((overlapnPts, 3), order='F')
-    predTKE = predTKE.squeeze()
-    predOmega = predOmega.squeeze()
-    predNut = predNut.squeeze()
+    projector.project()
+    writeCoeff(t, projector.coeff)
+    projector.reconstruct()
 
     interface.write_block_scalar_data(pressureID, vertexIDs, predPressure)
     interface.write_block_vector_data(velocityID, vertexIDs, predVelocity)
@@ -240,42 +304,17 @@ while interface.is_coupling_ongoing():
         pressureGradient = interface.read_block_scalar_data(pressureGradientID, vertexIDs)
 
     if interface.is_write_data_required(precice_dt):
-        snapTimeDIR = os.path.join(fieldDIR, '{0:.12g}'.format(t))
-        snapData = loadSerialCSV(os.path.join(snapTimeDIR, 'cloud_p_k_omega_nut.xy'))
-        pressure = snapData[:, 3]
-        tke = snapData[:, 4]
-        omega = snapData[:, 5]
-        nut = snapData[:, 6]
-        snapData = loadSerialCSV(os.path.join(snapTimeDIR, 'cloud_U.xy'))
-        velocity = snapData[:, 3:]
-        #-
-        # pressure = pressure[:, None]
-        velocity = velocity.reshape((overlapnPts*3, 1), order='F')
+        copySnapshot(prefetch.get(t, snapTimes(tStart, dt, it+1)), projector.field)
 
         #- Calculate coefficient (t=t_it)
-        aPressure = solveMin(modePressure.T@modePressure, modePressure.T@pressure)
-        aVelocity = solveMin(modeVelocity.T@modeVelocity, modeVelocity.T@velocity)
-        aTKE = solveMin(modeTKE.T@modeTKE, modeTKE.T@tke)
-        aOmega = solveMin(modeOmega.T@modeOmega, modeOmega.T@omega)
-        aNut = solveMin(modeNut.T@modeNut, modeNut.T@nut)
-        saveCoeff(t, [aPressure, aVelocity, aTKE, aOmega, aNut])
-
-        predPressure = modePressure@aPressure #- .T + modePressure[:, 0, None]
-        predVelocity = modeVelocity@aVelocity #- .T + modeVelocity[:, 0, None]
-        predTKE = modeTKE@aTKE #- .T + modeTKE[:, 0, None]
-        predOmega = modeOmega@aOmega #- .T + modeOmega[:, 0, None]
-        predNut = modeNut@aNut #- .T + modeOmega[:, 0, None]
-        #- 
-        predPressure = predPressure.squeeze()
-        predVelocity = predVelocity.reshape((overlapnPts, 3), order='F')
-        predTKE = predTKE.squeeze()
-        predOmega = predOmega.squeeze()
-        predNut = predNut.squeeze()
+        projector.project()
+        writeCoeff(t, projector.coeff)
+        projector.reconstruct()
 
     if interface.is_action_required(action_write_iteration_checkpoint()):
         interface.mark_action_fulfilled(action_write_iteration_checkpoint())
 
-    interface.write_block_scalar_data(pressureID, vertexIDs, predPressure.squeeze())
+    interface.write_block_scalar_data(pressureID, vertexIDs, predPressure)
     interface.write_block_vector_data(velocityID, vertexIDs, predVelocity)
     # interface.write_block_scalar_data(tkeID, vertexIDs, predTKE)
     # interface.write_block_scalar_data(omegaID, vertexIDs, predOmega)
@@ -295,4 +334,9 @@ while interface.is_coupling_ongoing():
     # else: 
     #     t += precice_dt
 
+prefetch.stop()
+print(prefetch.stats())
+if args.outFormat == 'log':
+    chronosLog.close()
+
 interface.finalize()
@@ -6,6 +6,11 @@
 # ---------------------------------------------------------------------------
 """ 
 Convert cloud data of field values obtained from wind-turbine simulation to VTK
+    Output in ./VTK: one file per time step (vtu, default), or a time series
+    <field>.vtkhdf or <field>.pvd (see utils/vtkSeries.py)
+    With -w, the chronos log of a running LF solver is followed: only the new
+    time steps are reconstructed, every `every`-th is written, and the relative
+    error of each written step is appended to ./VTK/reconError.<field>.dat
 """
 
 import numpy as np
@@ -14,10 +19,18 @@ import argparse
 import re
 import sys
 import os
+import time as clock
 from pathlib import Path
 
 from pyevtk.hl import pointsToVTK
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils'))
+from snapshotStore import snapshotReader
+from podBasis import podBasis
+from chronosLog import chronosReader, chronosTail
+from vtkSeries import vtkSeriesWriter
+
 # ---------------------------------------------------------------------------
 # UTILITY FUNCTION(S)
 # ---------------------------------------------------------------------------
@@ -34,7 +47,8 @@ def make_dir(dirPATH):
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class reconstructToVTK():
-    def __init__(self, podPATH, chronosPATH, refPATH, fieldNAME, nModes):
+    def __init__(self, podPATH, chronosPATH, refPATH, fieldNames, nModes, outFormat='vtu', 
+                 batchSize=64):
         #- User input
         self.timeRange = [100.01, 100.5] 
         self.ntSkip = 1
@@ -42,8 +56,13 @@ class reconstructToVTK():
         self.podPATH = podPATH
         self.chronosPATH = chronosPATH
         self.refPATH = refPATH
-        self.fieldNAME = fieldNAME
+        self.refReader = snapshotReader(refPATH)
+        self.fieldNames = fieldNames
         self.nModes = nModes
+        self.outFormat = outFormat
+        #- Time steps reconstructed at once (bounds the memory)
+        self.batchSize = batchSize
+        self.vtkDIR = os.path.join('.', 'VTK')
 
         #- Variable types
         self.scaList=["p", "p_rgh", "T", "Tprime", "k", "kSGS", "kSGSmean", 
@@ -56,6 +75,18 @@ class reconstructToVTK():
         self.tenCompNames = ["xx", "xy", "xz", "yy", "yz", "zz"]
 
     def createTimeList(self):
+        #- Coefficient log written by lf-solver
+        if chronosReader.isLog(self.chronosPATH):
+            self.chronosLog = chronosReader(self.chronosPATH)
+            timeInd = np.flatnonzero((self.chronosLog.times >= self.timeRange[0]) &
+                                     (self.chronosLog.times <= self.timeRange[1]))
+            self.timeInd = timeInd[::self.ntSkip]
+            self.timeList = self.chronosLog.times[self.timeInd]
+            self.timeListDIRS = ['{0:.12g}'.format(t) for t in self.timeList]
+            self.nt = len(self.timeList)
+            return
+        self.chronosLog = None
+
         #- Precision after decimal for float conversion
         nPrecFloat = 2
         listDir = np.array(get_subdir(self.chronosPATH))
@@ -84,72 +115,251 @@ class reconstructToVTK():
         for f in os.listdir(coordPATH):
             if f.startswith(coordFILENAME):
                 coordListFILE.append(os.path.basename(f))
-        #- Assign coordinate file 
+        #- Candidate coordinate files, in order of preference
+        #- NOTE: The masked coordinates (written with less precision) are only
+        #-       used if the modes are masked
+        candidates = []
+        if coordFILENAME+'.xy' in coordListFILE:
+            candidates.append((coordFILENAME+'.xy', [0,1,2]))
+        # if coordFILENAME+'.dat' in coordListFILE:
+        #     candidates.append((coordFILENAME+'.dat', [1,2,3]))
         if coordFILENAME+'.mask' in coordListFILE:
-            coordFILE = os.path.join(coordPATH,coordFILENAME+'.mask')
-            useInd = [0,1,2]
-        else:
-            if coordFILENAME+'.xy' in coordListFILE:
-                coordFILE = os.path.join(coordPATH,coordFILENAME+'.xy')
-                useInd = [0,1,2]
-            # if coordFILENAME+'.dat' in coordListFILE:
-            #     coordFILE = os.path.join(coordPATH,coordFILENAME+'.dat')
-            #     useInd = [1,2,3]
-        #- Read coodinates
-        self.coord = po.read_csv(coordFILE, 
-                              delim_whitespace=True, 
-                              header=None, 
-                              usecols=useInd).to_numpy()
-        self.npts = len(self.coord)
+            candidates.append((coordFILENAME+'.mask', [0,1,2]))
+        #- Read coodinates matching the size of the modes (first field)
+        fieldNAME = self.fieldNames[0]
+        for coordFILENAME, useInd in candidates:
+            coordFILE = os.path.join(coordPATH, coordFILENAME)
+            self.coord = po.read_csv(coordFILE, 
+                                  delim_whitespace=True, 
+                                  header=None, 
+                                  usecols=useInd).to_numpy()
+            self.npts = len(self.coord)
+            try:
+                podBasis(os.path.join(self.podPATH, 'modes.'+fieldNAME), 
+                         self.npts, self._fieldSize(fieldNAME))
+                break
+            except ValueError:
+                if coordFILENAME == candidates[-1][0]:
+                    raise
+        #- References at the points kept, for masked modes
+        if coordFILENAME.endswith('.mask'):
+            self.refReader = snapshotReader(self.refPATH, 
+                                            maskFILE=os.path.join(coordPATH, coordFILENAME+'.npy'))
+        #- Contiguous coordinates for pointsToVTK, shared by all time steps
+        self.X = np.ascontiguousarray(self.coord[:,0])
+        self.Y = np.ascontiguousarray(self.coord[:,1])
+        self.Z = np.ascontiguousarray(self.coord[:,2])
 
     def reconstruct(self):
-        #- Flags
-        isScalar = isVector = isTensor = False
-        #- Column index/indices in the snapshot file to use
-        if self.fieldNAME in self.scaList:
-            isScalar = True
-            nv = 1
-        if self.fieldNAME in self.vecList:
-            isVector = True
-            nv = 3
-        if self.fieldNAME in self.tenList:
-            isTensor = True
-            nv = 6
-
-        #- Modes
-        modeFILE = os.path.join(self.podPATH, 'modes.'+self.fieldNAME, 'mode.bin')
-        modes = np.fromfile(modeFILE, dtype=float)
-        modes = modes.reshape((self.nModes, self.npts*nv)).T
-
-        #- Reconstruct
+        for fld in self.fieldNames:
+            self.reconstructField(fld)
+
+    def reconstructField(self, fieldNAME):
+        #- Modes, read once
+        modes = self._readModes(fieldNAME)
+
+        #- Coefficients (nt, nModes)
+        chronosAll = self._readChronos(fieldNAME)
+
+        #- Output
+        make_dir(self.vtkDIR)
+        self.series = None
+        if self.outFormat != 'vtu':
+            self.series = vtkSeriesWriter(os.path.join(self.vtkDIR, fieldNAME), 
+                                          self.coord, self.outFormat)
+
+        #- Reference times, by name as in `timeListDIRS`
+        #- NOTE: The reference run usually writes less often than the coupling
+        #-       steps of the log; missing references are written as NaN
+        refNames = {'{0:.12g}'.format(float(name)): name 
+                    for name in self.refReader.timeNames(fieldNAME)}
+        nMissing = 0
+
+        #- Reconstruct `batchSize` time steps at once
+        #- NOTE: One GEMM per batch, (npts, nModes)@(nModes, nBatch); the
+        #-       reference snapshots of the batch are read in parallel
+        for ti0 in range(0, self.nt, self.batchSize):
+            ti1 = min(ti0+self.batchSize, self.nt)
+            predBatch = modes@chronosAll[ti0:ti1].T
+            names = [refNames.get('{0:.12g}'.format(t)) for t in self.timeList[ti0:ti1]]
+            available = [j for j, name in enumerate(names) if name is not None]
+            refBatch = np.full((ti1-ti0, self.npts), np.nan)
+            if available:
+                refBatch[available] = self.refReader.readMany([names[j] for j in available], 
+                                                              fieldNAME)[:, 0]
+            nMissing += ti1-ti0-len(available)
+            for ti in range(ti0, ti1):
+                predValue = np.ascontiguousarray(predBatch[:, ti-ti0])
+                refValue = refBatch[ti-ti0]
+                self._saveVTK(fieldNAME, predValue, refValue, 
+                              self.timeList[ti], self.timeListDIRS[ti])
+        if self.series is not None:
+            self.series.close()
+        if nMissing > 0:
+            print('{0}: no reference for {1:d} of {2:d} time steps'.format(
+                  fieldNAME, nMissing, self.nt))
+
+    def follow(self, every=1, pollInterval=10., idleTimeout=None):
+        #- Reconstruct the time steps appended to the chronos log, until the end
+        #- of `timeRange` or `idleTimeout` seconds without new steps
+        #- NOTE: The modes are read once; the cost of a poll depends only on the
+        #-       number of new steps
+        if not chronosReader.isLog(self.chronosPATH):
+            raise ValueError("Follow mode needs a chronos log (chronos.json) in {0}".format(
+                             self.chronosPATH))
+        tail = chronosTail(self.chronosPATH)
+        self.modes = {fld: self._readModes(fld) for fld in self.fieldNames}
+
+        #- Output
+        make_dir(self.vtkDIR)
+        self.seriesOf = {fld: None for fld in self.fieldNames}
+        if self.outFormat != 'vtu':
+            self.seriesOf = {fld: vtkSeriesWriter(os.path.join(self.vtkDIR, fld), 
+                                                  self.coord, self.outFormat) 
+                             for fld in self.fieldNames}
+        self.errFiles = {}
+        for fld in self.fieldNames:
+            errFILE = os.path.join(self.vtkDIR, 'reconError.'+fld+'.dat')
+            isNew = not os.path.isfile(errFILE) or os.path.getsize(errFILE) == 0
+            self.errFiles[fld] = open(errFILE, 'a')
+            if isNew:
+                self.errFiles[fld].write('# time relErrL2 meanRelErrL2\n')
+        self.errSum = {fld: 0. for fld in self.fieldNames}
+        self.errCount = {fld: 0 for fld in self.fieldNames}
+        #- Steps to write [t, tName, coefficients, reference, time queued], in
+        #- order; a step waits for its reference (see _writePending)
+        pending = {fld: [] for fld in self.fieldNames}
+
+        nSteps = 0
+        tLast = -np.inf
+        tIdle = clock.time()
+        isEnd = False
+        try:
+            while True:
+                times, coeffs = tail.poll()
+                #- New steps in range
+                #- NOTE: Times rewritten by a restarted solver are skipped
+                inRange = (times > tLast) & (times >= self.timeRange[0]) & (times <= self.timeRange[1])
+                stepInd = np.flatnonzero(inRange)
+                #- Every `every`-th step
+                emitInd = stepInd[(nSteps+np.arange(len(stepInd)))%every == 0]
+                nSteps += len(stepInd)
+                if len(stepInd) > 0:
+                    tLast = times[stepInd[-1]]
+                    tIdle = clock.time()
+                for fld in self.fieldNames:
+                    pending[fld] += [[times[i], '{0:.12g}'.format(times[i]), 
+                                      coeffs[fld][i, :self.nModes], None, clock.time()] 
+                                     for i in emitInd]
+                    self._writePending(fld, pending[fld], idleTimeout)
+                if len(emitInd) > 0:
+                    print('t = {0:.12g}: {1:d} step(s), {2:d} waiting for reference'.format(
+                          tLast, nSteps, len(pending[self.fieldNames[0]])))
+                if len(times) > 0 and times.max() > self.timeRange[1]:
+                    if not isEnd:
+                        print('End of time range reached')
+                    isEnd = True
+                if not isEnd and idleTimeout is not None and clock.time()-tIdle > idleTimeout:
+                    print('No new time steps for {0:g} s'.format(idleTimeout))
+                    isEnd = True
+                #- At the end, wait up to `idleTimeout` for missing references
+                if isEnd and (idleTimeout is None or 
+                              not any(len(pending[fld]) for fld in self.fieldNames)):
+                    break
+                clock.sleep(pollInterval)
+        except KeyboardInterrupt:
+            print('Interrupted')
+        finally:
+            for fld in self.fieldNames:
+                self._writePending(fld, pending[fld], idleTimeout, final=True)
+                self.errFiles[fld].close()
+                if self.seriesOf[fld] is not None:
+                    self.seriesOf[fld].close()
+
+    def _writePending(self, fieldNAME, pending, idleTimeout, final=False):
+        #- Write the pending steps, in order, whose reference is available; a
+        #- step without reference is written (NaN) once a later step has one
+        #- (reference written less often), after `idleTimeout` s, or if final
+        now = clock.time()
+        for step in pending:
+            if step[3] is None:
+                step[3] = self._readRef(step[1], fieldNAME)
+        lastRef = max([i for i, step in enumerate(pending) if step[3] is not None], default=-1)
+        nWrite = 0
+        for i, step in enumerate(pending):
+            isExpired = idleTimeout is not None and now-step[4] > idleTimeout
+            if step[3] is None and i > lastRef and not (final or isExpired):
+                break
+            nWrite += 1
+        if nWrite == 0:
+            return
+        steps = pending[:nWrite]
+        del pending[:nWrite]
+
+        #- One GEMM for the steps written
+        self.series = self.seriesOf[fieldNAME]
+        predBatch = self.modes[fieldNAME]@np.array([step[2] for step in steps]).T
+        for j, (t, tName, _, refValue, _) in enumerate(steps):
+            predValue = np.ascontiguousarray(predBatch[:, j])
+            if refValue is None:
+                self._saveVTK(fieldNAME, predValue, np.full(self.npts, np.nan), t, tName)
+                continue
+            self._saveVTK(fieldNAME, predValue, refValue, t, tName)
+            #- Relative L2 error
+            relErr = np.linalg.norm(predValue-refValue)/np.linalg.norm(refValue)
+            self.errSum[fieldNAME] += relErr
+            self.errCount[fieldNAME] += 1
+            self.errFiles[fieldNAME].write('{0} {1:g} {2:g}\n'.format(
+                tName, relErr, self.errSum[fieldNAME]/self.errCount[fieldNAME]))
+        self.errFiles[fieldNAME].flush()
+        if self.series is not None:
+            self.series.flush()
+
+    def _fieldSize(self, fieldNAME):
+        #- Number of components
+        if fieldNAME in self.scaList:
+            return 1
+        if fieldNAME in self.vecList:
+            return 3
+        if fieldNAME in self.tenList:
+            return 6
+
+    def _readModes(self, fieldNAME):
+        #- First component of vector and tensor fields, (npts, nModes)
+        #- NOTE: Components are stacked, [x(0..npts-1), y(0..npts-1), ...]
+        modes = podBasis(os.path.join(self.podPATH, 'modes.'+fieldNAME),
+                         self.npts, self._fieldSize(fieldNAME)).matrix((0, self.nModes))
+        return np.array(modes[:self.npts])
+
+    def _readRef(self, tName, fieldNAME):
+        #- First component of the reference field, None if not (yet) written
+        try:
+            refValue = self.refReader.read(tName, fieldNAME)[:,0]
+        except (OSError, ValueError):
+            return None
+        return refValue if len(refValue) == self.npts else None
+
+    def _readChronos(self, fieldNAME):
+        #- Coefficients from the log
+        if self.chronosLog is not None:
+            return self.chronosLog.read(fieldNAME, self.timeInd)[:, :self.nModes]
+        #- Coefficients from text files <chronosPATH>/<time>/<field>
+        chronosAll = np.empty((self.nt, self.nModes))
         for ti in range(self.nt):
-            #- Coefficients
-            chronosFILE = os.path.join(self.chronosPATH, self.timeListDIRS[ti], self.fieldNAME)
-            chronos = po.read_csv(chronosFILE, delim_whitespace=True, header=None).to_numpy()
-            #- Reconstruction
-            predValue = modes@chronos
-            if isScalar:
-                predValue = predValue.squeeze()
-            else:
-                predValue = predValue.reshape((self.npts, nv), order='F')
-                predValue = predValue[:,0]
-            #- Reference value
-            refFILE = os.path.join(self.refPATH, '{0:.12g}'.format(self.timeList[ti]), 'cloud_'+self.fieldNAME+'.xy')
-            refValue = po.read_csv(refFILE, delim_whitespace=True, header=None).to_numpy()
-            refValue = refValue[:,0]
-
-            self._saveVTK(predValue, refValue, ti)
-
-    def _saveVTK(self, fieldValue, refValue, ti):
-        X = np.ascontiguousarray(self.coord[:,0])
-        Y = np.ascontiguousarray(self.coord[:,1])
-        Z = np.ascontiguousarray(self.coord[:,2])
-        vtkFILENAME = self.fieldNAME+'_'+self.timeListDIRS[ti] # '{0:05d}'.format(ti)
-        vtkDIR = os.path.join('.', 'VTK')
-        make_dir(vtkDIR)
-        pointsToVTK(os.path.join(vtkDIR, vtkFILENAME), 
-                    X, Y, Z, 
-                    data={self.fieldNAME: fieldValue, self.fieldNAME+'ref': refValue})
+            chronosFILE = os.path.join(self.chronosPATH, self.timeListDIRS[ti], fieldNAME)
+            chronosAll[ti] = po.read_csv(chronosFILE, delim_whitespace=True, 
+                                         header=None).to_numpy().ravel()[:self.nModes]
+        return chronosAll
+
+    def _saveVTK(self, fieldNAME, fieldValue, refValue, t, tName):
+        data = {fieldNAME: fieldValue, fieldNAME+'ref': refValue}
+        if self.series is not None:
+            self.series.write(t, data)
+            return
+        vtkFILENAME = fieldNAME+'_'+tName # '{0:05d}'.format(ti)
+        pointsToVTK(os.path.join(self.vtkDIR, vtkFILENAME), 
+                    self.X, self.Y, self.Z, 
+                    data=data)
 
 # ---------------------------------------------------------------------------
 # MAIN FUNCTION
@@ -177,14 +387,42 @@ def main():
                     default="../../run.hf/postProcessing/internalField"
                     )
     CLI.add_argument('-f', '--fieldNAME', 
-                    help="Field name", 
-                    nargs='?', 
+                    help="Field name(s)", 
+                    nargs='*', 
                     type=str,
-                    default='U') #- 'p', 'p_rgh', 'T', 'U'
+                    default=['U']) #- 'p', 'p_rgh', 'T', 'U'
     CLI.add_argument('-n', '--nModes', 
                     help="Number of modes", 
                     nargs='?', 
                     type=int)
+    CLI.add_argument('-o', '--outFormat', 
+                    help="One VTK file per time step, or a time series", 
+                    nargs='?', 
+                    type=str,
+                    choices=['vtu', 'vtkhdf', 'pvd'],
+                    default='vtu')
+    CLI.add_argument('-b', '--batchSize', 
+                    help="Time steps reconstructed at once", 
+                    nargs='?', 
+                    type=int,
+                    default=64)
+    CLI.add_argument('-w', '--follow', 
+                    help="Follow the chronos log of a running LF solver", 
+                    action='store_true')
+    CLI.add_argument('-e', '--every', 
+                    help="Follow mode: write every e-th new time step", 
+                    nargs='?', 
+                    type=int,
+                    default=1)
+    CLI.add_argument('-i', '--pollInterval', 
+                    help="Follow mode: seconds between checks of the log", 
+                    nargs='?', 
+                    type=float,
+                    default=10.)
+    CLI.add_argument('-t', '--idleTimeout', 
+                    help="Follow mode: stop after this many seconds without new steps", 
+                    nargs='?', 
+                    type=float)
 
     try:
         args = CLI.parse_args()
@@ -196,10 +434,15 @@ def main():
                          args.chronosPATH,
                          args.refPATH,
                          args.fieldNAME,
-                         args.nModes)
-    p.createTimeList()
+                         args.nModes,
+                         args.outFormat,
+                         args.batchSize)
     p.getCoord()
-    p.reconstruct()
+    if args.follow:
+        p.follow(args.every, args.pollInterval, args.idleTimeout)
+    else:
+        p.createTimeList()
+        p.reconstruct()
 
     print('DONE!')
 
@@ -6,6 +6,11 @@
 # ---------------------------------------------------------------------------
 """ 
 Post-evaluation of coupling data error
+    Snapshots are read in chunks of `chunkSize` times (in parallel) and
+    projected on the POD basis with one pair of matrix products per chunk; with
+    --streaming only the error statistics are kept, not the fields. For a POD
+    of masked snapshots (assembleSnapshots.py -k), --maskFILE gives the mask
+    (.npy) applied to the snapshots read.
 """
 from __future__ import division, print_function
 
@@ -20,6 +25,11 @@ import sys
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils'))
+from snapshotStore import snapshotReader, fieldSize, loadMask
+from podBasis import podBasis
+
 # ---------------------------------------------------------------------------
 # UTILITY FUNCTION(S)
 # ---------------------------------------------------------------------------
@@ -36,12 +46,21 @@ def loadFoamCSV(fileID):
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class getError():
-    def __init__(self, referenceDIR, solutionDIR, podDIR, coordFILE, fields):
+    def __init__(self, referenceDIR, solutionDIR, podDIR, coordFILE, fields, 
+                 chunkSize=64, nWorkers=None, streaming=False, maskFILE=None):
         self.referenceDIR = referenceDIR
         self.solutionDIR = solutionDIR
         self.podDIR = podDIR
         self.coordFILE = coordFILE
         self.fields = fields
+        #- Time steps read and projected at once
+        self.chunkSize = chunkSize
+        #- Threads reading the files of a chunk (None: default of ThreadPoolExecutor)
+        self.nWorkers = nWorkers
+        #- Only the error statistics are kept, not the fields at all times
+        self.streaming = streaming
+        #- Mask of the points dropped from the POD snapshots (optional)
+        self.maskFILE = maskFILE
 
         runID = re.split('_|\*|\n', self.podDIR)
         for s in runID:
@@ -63,58 +82,103 @@ class getError():
         #- Read coordinate
         self.grid = loadFoamCSV(self.coordFILE)
         self.nPts = self.grid.shape[0]
+        if self.maskFILE:
+            nPtsAll, keepInd = loadMask(self.maskFILE)
+            if nPtsAll != self.nPts:
+                raise ValueError("Mask {0} has {1} points, {2} has {3}".format(
+                                 self.maskFILE, nPtsAll, self.coordFILE, self.nPts))
+            self.grid = self.grid.iloc[keepInd]
+            self.nPts = len(keepInd)
 
-        #- Read data
+        #- Read data (points kept by the mask, if any)
+        referenceReader = snapshotReader(self.referenceDIR, maskFILE=self.maskFILE)
+        solutionReader = snapshotReader(self.solutionDIR, maskFILE=self.maskFILE)
+        referenceTimes = ['{0:g}'.format(t-0.01) for t in self.timeList]
+        solutionTimes = ['{0:g}'.format(t) for t in self.timeList]
         self.referenceData = {}
         self.solutionData = {}
         self.podData = {}
+        #- Error statistics, accumulated chunk by chunk
+        #- NOTE: Squared magnitudes, summed over points (per time) or times (per point)
+        self.referenceSqTime = {}
+        self.solutionErrSqTime = {}
+        self.podErrSqTime = {}
+        self.referenceSqPoint = {}
+        self.solutionErrSqPoint = {}
+        self.podErrSqPoint = {}
         for fldID in self.fields:
-            if fldID in ['p', 'T', ]:
-                self.nv = 1
-            elif fldID in ['U', ]:
-                self.nv = 3
-            self.referenceData[fldID] = np.zeros((self.nPts, self.nv, self.nt))
-            self.solutionData[fldID] = np.zeros((self.nPts, self.nv, self.nt))
-            self.podData[fldID] = np.zeros((self.nPts, self.nv, self.nt))
-            for it, t in enumerate(self.timeList):
-                refFILE = os.path.join(self.referenceDIR, '{0:g}'.format(t-0.01), 'cloud_'+fldID+'.xy')
-                pointData = loadFoamCSV(refFILE)
-                self.referenceData[fldID][:,:,it] = pointData.to_numpy()
-                #
-                solFILE = os.path.join(self.solutionDIR, '{0:g}'.format(t), 'cloud_'+fldID+'.xy')
-                pointData = loadFoamCSV(solFILE)
-                self.solutionData[fldID][:,:,it] = pointData.to_numpy()
-
-            #- Read POD modes
-            modeFld = np.fromfile(os.path.join(self.podDIR, 'modes.'+fldID, 'mode.bin'), dtype=float)
-            modeFld = modeFld.reshape((self.nModes, self.nPts*self.nv)).T
-            for it, t in enumerate(self.timeList):
-                fldData = self.referenceData[fldID][:,:,it].reshape((self.nPts*self.nv, 1), order='F')
-                aFld = fldData.T@modeFld
-                predFld = modeFld@aFld.T #- + modeFld[:, 0, None]
-                self.podData[fldID][:,:,it] = predFld.reshape((self.nPts, self.nv), order='F')
+            self.nv = fieldSize(fldID)
+            nv = self.nv
+            if not self.streaming:
+                self.referenceData[fldID] = np.zeros((self.nPts, nv, self.nt))
+                self.solutionData[fldID] = np.zeros((self.nPts, nv, self.nt))
+                self.podData[fldID] = np.zeros((self.nPts, nv, self.nt))
+            self.referenceSqTime[fldID] = np.zeros(self.nt)
+            self.solutionErrSqTime[fldID] = np.zeros(self.nt)
+            self.podErrSqTime[fldID] = np.zeros(self.nt)
+            self.referenceSqPoint[fldID] = np.zeros(self.nPts)
+            self.solutionErrSqPoint[fldID] = np.zeros(self.nPts)
+            self.podErrSqPoint[fldID] = np.zeros(self.nPts)
+
+            #- Read POD modes (nv*nPts, nModes), once
+            modeFld = np.array(podBasis(os.path.join(self.podDIR, 'modes.'+fldID),
+                                        self.nPts, nv).matrix((0, self.nModes)))
+
+            #- Buffers of a chunk (time, component, point), reused
+            #- NOTE: A snapshot (nv, nPts) is a row of the mode layout, 
+            #-       [x(0..nPts-1), y(0..nPts-1), ...]
+            nBuf = min(self.chunkSize, self.nt)
+            referenceBuf = np.empty((nBuf, nv, self.nPts))
+            solutionBuf = np.empty((nBuf, nv, self.nPts))
+            for it0 in range(0, self.nt, nBuf):
+                it1 = min(it0+nBuf, self.nt)
+                nc = it1-it0
+                referenceReader.readMany(referenceTimes[it0:it1], fldID, 
+                                         out=referenceBuf[:nc], nWorkers=self.nWorkers)
+                solutionReader.readMany(solutionTimes[it0:it1], fldID, 
+                                        out=solutionBuf[:nc], nWorkers=self.nWorkers)
+
+                #- Projection of all snapshots of the chunk
+                fldData = referenceBuf[:nc].reshape((nc, nv*self.nPts))
+                aFld = fldData@modeFld
+                predFld = (aFld@modeFld.T).reshape((nc, nv, self.nPts)) #- + modeFld[:, 0, None]
+
+                self._accumulate(fldID, it0, referenceBuf[:nc], solutionBuf[:nc], predFld)
+                if not self.streaming:
+                    self.referenceData[fldID][:,:,it0:it1] = referenceBuf[:nc].transpose((2,1,0))
+                    self.solutionData[fldID][:,:,it0:it1] = solutionBuf[:nc].transpose((2,1,0))
+                    self.podData[fldID][:,:,it0:it1] = predFld.transpose((2,1,0))
+
+    def _accumulate(self, fldID, it0, referenceChunk, solutionChunk, podChunk):
+        #- Get magnitude (no effect on scalars), (time, point)
+        referenceNorm = np.linalg.norm(referenceChunk, axis=1)
+        solutionNorm = np.linalg.norm(solutionChunk, axis=1)
+        podNorm = np.linalg.norm(podChunk, axis=1)
+        #-
+        solutionErrSq = (solutionNorm-referenceNorm)**2
+        podErrSq = (podNorm-referenceNorm)**2
+        referenceSq = referenceNorm**2
+
+        it1 = it0+len(referenceChunk)
+        self.referenceSqTime[fldID][it0:it1] = referenceSq.sum(axis=1)
+        self.solutionErrSqTime[fldID][it0:it1] = solutionErrSq.sum(axis=1)
+        self.podErrSqTime[fldID][it0:it1] = podErrSq.sum(axis=1)
+        self.referenceSqPoint[fldID] += referenceSq.sum(axis=0)
+        self.solutionErrSqPoint[fldID] += solutionErrSq.sum(axis=0)
+        self.podErrSqPoint[fldID] += podErrSq.sum(axis=0)
 
     def getRelativeError(self):
         self.solutionRelError = {}
         self.podRelError = {}
         for fldID in self.fields:
-            #- Get magnitude (no effect on scalars)
-            referenceNorm = np.linalg.norm(self.referenceData[fldID], axis=1)
-            solutionNorm = np.linalg.norm(self.solutionData[fldID], axis=1)
-            podNorm = np.linalg.norm(self.podData[fldID], axis=1)
-            #-
-            solutionErr = np.abs(solutionNorm-referenceNorm)
-            podErr = np.abs(podNorm-referenceNorm)
-            
             #- Relative spatial mean (for plotting)
-            referenceNormSpaceMean = np.mean(referenceNorm**2, axis=0)
-            self.solutionRelError[fldID] = np.sqrt(np.mean(solutionErr**2, axis=0)/referenceNormSpaceMean)
-            self.podRelError[fldID] = np.sqrt(np.mean(podErr**2, axis=0)/referenceNormSpaceMean)
+            #- NOTE: Ratio of means over points, i.e. of sums
+            self.solutionRelError[fldID] = np.sqrt(self.solutionErrSqTime[fldID]/self.referenceSqTime[fldID])
+            self.podRelError[fldID] = np.sqrt(self.podErrSqTime[fldID]/self.referenceSqTime[fldID])
 
             #- Relative temporal error mean
-            referenceNormTimeMean = np.mean(referenceNorm**2, axis=1)
-            solutionRelErrTimeMean = np.sqrt(np.mean(solutionErr**2, axis=1)/referenceNormTimeMean)
-            podRelErrTimeMean = np.sqrt(np.mean(podErr**2, axis=1)/referenceNormTimeMean)
+            solutionRelErrTimeMean = np.sqrt(self.solutionErrSqPoint[fldID]/self.referenceSqPoint[fldID])
+            podRelErrTimeMean = np.sqrt(self.podErrSqPoint[fldID]/self.referenceSqPoint[fldID])
             
             #- Spatial mean
             solutionErrSpaceMean = np.mean(solutionRelErrTimeMean)
@@ -176,6 +240,22 @@ def main():
                     nargs='*', 
                     type=str,
                     default=['p', 'U'])
+    CLI.add_argument('--chunkSize', 
+                    help="Time steps read and projected at once", 
+                    nargs='?', 
+                    type=int,
+                    default=64)
+    CLI.add_argument('--nWorkers', 
+                    help="Threads reading snapshots", 
+                    nargs='?', 
+                    type=int)
+    CLI.add_argument('--streaming', 
+                    help="Keep only the error statistics (long runs)", 
+                    action='store_true')
+    CLI.add_argument('--maskFILE', 
+                    help="Mask (.npy) of the POD snapshots, from createMask.py (optional)", 
+                    nargs='?', 
+                    type=str)
 
     try:
         args = CLI.parse_args()
@@ -188,7 +268,11 @@ def main():
                  args.solutionDIR, 
                  args.podDIR, 
                  args.coordFILE,
-                 args.fields)
+                 args.fields,
+                 args.chunkSize,
+                 args.nWorkers,
+                 args.streaming,
+                 args.maskFILE)
     p.createTimeList()
     p.readData()
     p.getRelativeError()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Persistent line-offset index of OpenFOAM probe files
+    Stores the header length, number of probes, and the byte offset and time
+    of every data row in a hidden sidecar file next to the probe file.
+RUN:
+    $ python probeIndex.py $probeFILE [$probeFILE ...]
+"""
+
+import numpy as np
+import hashlib
+import os
+import sys
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class probeIndex():
+    def __init__(self, fieldFILE):
+        self.fieldFILE = os.path.abspath(fieldFILE)
+        #- NOTE: Hidden file, so that shell globs listing the fields skip it
+        dirNAME, fileNAME = os.path.split(self.fieldFILE)
+        self.indexFILE = os.path.join(dirNAME, '.'+fileNAME+'.index.npz')
+
+        #- Size of blocks searched for newlines
+        self.blockSize = 64*1024**2
+
+    def load(self):
+        #- Reuse, extend or rebuild the index depending on the probe file state
+        stat = os.stat(self.fieldFILE)
+        idx = self._read()
+        if idx is None:
+            self._build()
+        elif idx['fileSize'] == stat.st_size and idx['fileMtime'] == stat.st_mtime_ns:
+            self._assign(idx)
+            return self
+        elif self._isAppended(idx, stat.st_size):
+            self._extend(idx)
+        else:
+            self._build()
+        self.fileSize = stat.st_size
+        self.fileMtime = stat.st_mtime_ns
+        self._save()
+        return self
+
+    def toDict(self):
+        #- Content needed by other processes (e.g. for MPI broadcast)
+        return {'nHeader': self.nHeader,
+                'nCoord': self.nCoord,
+                'rowOffsets': self.rowOffsets,
+                'times': self.times,
+                'timeNames': self.timeNames}
+
+    def _build(self):
+        #- Header: leading lines starting with '#'
+        self.nHeader = 0
+        self.nCoord = 0
+        dataStart = 0
+        with open(self.fieldFILE, 'rb') as f:
+            for line in f:
+                if not line.startswith(b'#'):
+                    break
+                if line.startswith(b'# Probe '):
+                    self.nCoord += 1
+                self.nHeader += 1
+                dataStart += len(line)
+            f.seek(0)
+            self.headerHash = hashlib.sha1(f.read(dataStart)).hexdigest()
+        self.rowOffsets = np.array([dataStart], dtype=np.int64)
+        self.times = np.empty(0)
+        self.timeNames = np.empty(0, dtype=str)
+        self.resumeOffset = dataStart
+        self.tailHash = ''
+        self._scanRows()
+
+    def _extend(self, idx):
+        #- Keep rows terminated before the resume offset, rescan from there
+        self._assign(idx)
+        rowStarts = self.rowOffsets[self.rowOffsets < self.resumeOffset]
+        self.rowOffsets = np.append(rowStarts, self.resumeOffset)
+        self.times = self.times[:len(rowStarts)]
+        self.timeNames = self.timeNames[:len(rowStarts)]
+        self._scanRows()
+
+    def _scanRows(self):
+        #- Append the rows found after `resumeOffset`
+        #- NOTE: A last row without trailing newline is indexed, but the index
+        #-       resumes from its start when the file is extended.
+        pos = self.resumeOffset
+        rowStarts = [self.rowOffsets[:-1], np.array([pos], dtype=np.int64)]
+        with open(self.fieldFILE, 'rb') as f:
+            f.seek(pos)
+            while True:
+                block = f.read(self.blockSize)
+                if not block:
+                    break
+                newlineInd = np.flatnonzero(
+                                np.frombuffer(block, dtype=np.uint8)==ord('\n'))
+                rowStarts.append(newlineInd.astype(np.int64)+pos+1)
+                pos += len(block)
+            rowStarts = np.concatenate(rowStarts)
+            self.resumeOffset = int(rowStarts[-1])
+            #- End of the unterminated last row
+            if self.resumeOffset < pos:
+                rowStarts = np.append(rowStarts, pos)
+            self.rowOffsets = rowStarts
+
+            #- Time of the new rows
+            nOld = len(self.times)
+            timeNames = list(self.timeNames)
+            for off in self.rowOffsets[nOld:-1]:
+                f.seek(off)
+                timeNames.append(f.read(128).split(None, 1)[0].decode())
+            self.timeNames = np.array(timeNames, dtype=str)
+            self.times = self.timeNames.astype(float)
+
+            #- Signature of the last newline-terminated row
+            self.tailHash = ''
+            nTerminated = np.searchsorted(self.rowOffsets, self.resumeOffset)
+            if nTerminated > 0:
+                f.seek(self.rowOffsets[nTerminated-1])
+                tail = f.read(self.resumeOffset-self.rowOffsets[nTerminated-1])
+                self.tailHash = hashlib.sha1(tail).hexdigest()
+
+    def _isAppended(self, idx, fileSize):
+        #- The file grew and the indexed header and last row are unchanged
+        if fileSize <= idx['fileSize']:
+            return False
+        dataStart = idx['rowOffsets'][0]
+        resumeOffset = idx['resumeOffset']
+        nTerminated = np.searchsorted(idx['rowOffsets'], resumeOffset)
+        with open(self.fieldFILE, 'rb') as f:
+            if hashlib.sha1(f.read(dataStart)).hexdigest() != idx['headerHash']:
+                return False
+            if nTerminated > 0:
+                f.seek(idx['rowOffsets'][nTerminated-1])
+                tail = f.read(resumeOffset-idx['rowOffsets'][nTerminated-1])
+                if hashlib.sha1(tail).hexdigest() != idx['tailHash']:
+                    return False
+        return True
+
+    def _assign(self, idx):
+        for key in ['nHeader', 'nCoord', 'fileSize', 'fileMtime', 'resumeOffset']:
+            setattr(self, key, int(idx[key]))
+        for key in ['headerHash', 'tailHash']:
+            setattr(self, key, str(idx[key]))
+        self.rowOffsets = idx['rowOffsets']
+        self.times = idx['times']
+        self.timeNames = idx['timeNames']
+
+    def _read(self):
+        if not os.path.isfile(self.indexFILE):
+            return None
+        try:
+            with np.load(self.indexFILE) as data:
+                return {key: data[key] for key in data.files}
+        except (OSError, ValueError, KeyError):
+            print("WARNING: Ignoring unreadable index {0}".format(self.indexFILE))
+            return None
+
+    def _save(self):
+        #- Write to a temporary file first so that readers never see a partial index
+        tmpFILE = self.indexFILE+'.tmp.npz'
+        try:
+            np.savez(tmpFILE,
+                     nHeader=self.nHeader,
+                     nCoord=self.nCoord,
+                     fileSize=self.fileSize,
+                     fileMtime=self.fileMtime,
+                     resumeOffset=self.resumeOffset,
+                     headerHash=self.headerHash,
+                     tailHash=self.tailHash,
+                     rowOffsets=self.rowOffsets,
+                     times=self.times,
+                     timeNames=self.timeNames)
+            os.replace(tmpFILE, self.indexFILE)
+        except OSError:
+            print("WARNING: Could not save index {0}".format(self.indexFILE))
+
+    @property
+    def nt(self):
+        return len(self.rowOffsets)-1
+
+# ---------------------------------------------------------------------------
+# MAIN FUNCTION
+# ---------------------------------------------------------------------------
+def main():
+    #- Read arguments
+    #- NOTE: sys.argv[0] is always the script name
+    for fieldFILE in sys.argv[1:]:
+        p = probeIndex(fieldFILE).load()
+        print('{0}: probes={1}, header={2}, rows={3}'.format(
+              fieldFILE, p.nCoord, p.nHeader, p.nt))
+
+# ---------------------------------------------------------------------------
+# COMMAND LINE EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
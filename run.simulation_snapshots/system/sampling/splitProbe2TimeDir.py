@@ -20,6 +20,14 @@ from itertools import islice
 
 from mpi4py import MPI
 
+from probeIndex import probeIndex
+
+#- Shared utilities
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                             '..', '..', '..', 'utils'))
+from snapshotStore import snapshotStore
+from taskScheduler import taskScheduler
+
 comm = MPI.COMM_WORLD
 MPI_RANK = comm.Get_rank()
 MPI_SIZE = comm.Get_size()
@@ -31,14 +39,41 @@ MPI_SIZE = comm.Get_size()
 def make_dir(dirPATH):
     Path(dirPATH).mkdir(parents=True, exist_ok=True)
 
+#- Parentheses of vector/tensor values replaced by spaces
+parenthesesToSpace = str.maketrans('()', '  ')
+
+#- Smallest '%.<prec>g' reproducing all value tokens of a row, None if none
+def rowPrecision(tokens):
+    values = [float(v) for v in tokens]
+    for prec in range(1, 18):
+        if all('%.*g' % (prec, v) == tok for v, tok in zip(values, tokens)):
+            return prec
+    return None
+
+#- Significant digits of the shortest repr of a float
+def reprDigits(value):
+    mantissa = repr(value).split('e')[0].replace('-', '').replace('.', '')
+    return len(mantissa.strip('0'))
+
 # ---------------------------------------------------------------------------
 # SUBFUNCTION(S)
 # ---------------------------------------------------------------------------
 class splitProbe2TimeDir():
-    def __init__(self, probesSUBDIR, fieldNAME, coordFILE):
+    def __init__(self, probesSUBDIR, fieldNAME, coordFILE, readMode='stream', 
+                 parser='text', writePrecision=None, outFormat='dirs'):
         self.probesSUBDIR = os.path.abspath(probesSUBDIR)
         self.fieldNAME = fieldNAME
         self.coordFILE = coordFILE
+        #- Reading strategy: 'stream' (seek to rank's byte range) or 'islice'
+        self.readMode = readMode
+        #- Row parsing: 'text' (row-wise token copy) or 'array' (block to floats)
+        self.parser = parser
+        #- Significant digits of values in probe file (inferred if None)
+        self.writePrecision = writePrecision
+        #- Maximum size of the block of rows parsed at once (bytes)
+        self.blockBytes = 64*1024**2
+        #- Output: time directories of cloud files ('dirs') or snapshot store
+        self.outFormat = outFormat
 
         #- Variable types
         self.scaList=["p", "p_rgh", "T", "Tprime", "k", "kSGS", "kSGSmean", 
@@ -46,15 +81,21 @@ class splitProbe2TimeDir():
         self.vecList=["U", "Uprime"]
         self.tenList=["Rmean"]
 
-    def getCoordinates(self):
-        #- Get number of probe points
+    def getIndex(self):
+        #- Load (or build/extend) the line-offset index of the probe file
         self.fieldFILE = os.path.join(self.probesSUBDIR, self.fieldNAME)
-        with open(self.fieldFILE, 'r') as f:
-            for line in f:
-                if line.startswith('#             Probe'):
-                    self.nCoord = len(line.split())-2
-                    break
+        idx = None
+        if MPI_RANK == 0:
+            idx = probeIndex(self.fieldFILE).load().toDict()
+        idx = comm.bcast(idx, root=0)
+        #- Number of header lines and probe points
+        self.nHeader = idx['nHeader']
+        self.nCoord = idx['nCoord']
+        #- Byte offset of each data row (and end of last row), and its time
+        self.rowOffsets = idx['rowOffsets']
+        self.timeNames = idx['timeNames']
 
+    def getCoordinates(self):
         #- Get probe coordinates
         self.coordPts = np.empty((self.nCoord, 3))
         if MPI_RANK == 0:
@@ -92,9 +133,6 @@ class splitProbe2TimeDir():
         comm.Bcast([self.coordPts, MPI.DOUBLE], root=0)
         self.nCoord = self.coordPts.shape[0]
 
-        #- Number of header lines in file
-        self.nHeader = self.nCoord+2
-
     def getCloud(self):
         #- Column index/indices in the snapshot file to use
         fld = self.fieldNAME
@@ -119,14 +157,14 @@ class splitProbe2TimeDir():
             if probesDIR.endswith(suffix):
                 self.snapsDIR = probesDIR.removesuffix(suffix)
         if self.snapsDIR:
-            make_dir(self.snapsDIR)
+            if self.outFormat == 'dirs':
+                make_dir(self.snapsDIR)
         else:
             print("ERROR: Directory name {0} must end with {1}".format(probesDIR, suffix))
             comm.abort()
 
         #- Read line and transform to column
         timeIndFull = np.arange(self.nt)
-        ntPerRank = len(self.timeIndPerRank)
 
         #- Option [1]
         # for i in range(ntPerRank):
@@ -152,57 +190,191 @@ class splitProbe2TimeDir():
         #             elif lineNinFile > lineN:
         #                 break
 
+        #- Option [4]: Write the parsed blocks to the snapshot store
+        if self.outFormat == 'store':
+            self._writeStore()
+
         #- Option [2]
-        lineNInRank = [timeIndFull[self.timeIndPerRank[i]]+self.nHeader+1
-                                for i in range(ntPerRank)]
-        for n in lineNInRank:
-            with open(self.fieldFILE, 'r') as f:
-                for line in islice(f, n-1, n):
-                    self._formatLine(line)
+        elif self.readMode == 'islice':
+            for i in self.scheduler.tasks():
+                n = timeIndFull[i]+self.nHeader+1
+                with open(self.fieldFILE, 'r') as f:
+                    for line in islice(f, n-1, n):
+                        self._formatLine(line)
+
+        #- Option [3]
+        #- NOTE: Time indices of a chunk are contiguous, so a single seek to the
+        #-       first row followed by one forward pass reads all of them.
+        elif self.readMode == 'stream':
+            if self.parser == 'array':
+                self._getPrecision()
+            for _, _, block in self._readBlocks():
+                if self.parser == 'array':
+                    self._formatBlock(block)
+                else:
+                    for line in block.decode().splitlines():
+                        self._formatLine(line)
+
+        #- Per-rank timing
+        self.scheduler.report(os.path.basename(os.path.normpath(self.probesSUBDIR))
+                              +'/'+self.fieldNAME)
+
+    def _readBlocks(self):
+        #- Yield blocks of rows (first index, end index, bytes) of the chunks
+        #- claimed by the rank
+        with open(self.fieldFILE, 'rb') as f:
+            for iStart, iEnd in self.scheduler.chunks():
+                f.seek(self.rowOffsets[iStart])
+                while iStart < iEnd:
+                    #- Rows fitting in a block (at least one)
+                    iBlockEnd = np.searchsorted(self.rowOffsets, 
+                                    self.rowOffsets[iStart]+self.blockBytes, 
+                                    side='right')-1
+                    iBlockEnd = min(max(iBlockEnd, iStart+1), iEnd)
+                    block = f.read(self.rowOffsets[iBlockEnd]-self.rowOffsets[iStart])
+                    yield iStart, iBlockEnd, block
+                    iStart = iBlockEnd
+
+    def _writeStore(self):
+        #- Reserve the rows of all times on rank 0, then fill them from each rank
+        storeDIR = self.snapsDIR+'.store'
+        rows = None
+        if MPI_RANK == 0:
+            store = snapshotStore(storeDIR)
+            if store.readCoord() is None:
+                store.writeCoord(self.coordPts)
+            rows = store.reserve(self.fieldNAME, self.nv, self.nCoord, 
+                                 [str(t) for t in self.timeNames])
+        rows = comm.bcast(rows, root=0)
+        store = snapshotStore(storeDIR)
+        for iStart, iEnd, block in self._readBlocks():
+            _, values = self._parseBlock(block)
+            if values is None:
+                #- Malformed block: parse line-wise
+                values = np.array([np.fromstring(self._lineToCloud(line)[1], sep=' ') 
+                                   for line in block.decode().splitlines()])
+            store.write(self.fieldNAME, rows[iStart:iEnd], values)
+        comm.Barrier()
 
     def _formatLine(self, line):
-        tN = line.split()[0]
+        tN, cloudStr = self._lineToCloud(line)
+        self._writeCloud(tN, cloudStr)
+
+    def _formatBlock(self, block):
+        timeNames, values = self._parseBlock(block)
+        cloudStrs = None
+        if self.cloudFmt is not None and values is not None:
+            cloudStrs = self._formatValues(values)
+        #- Fall back to line-wise formatting if the block cannot be reproduced
+        #- NOTE: Output must stay byte-compatible with _lineToCloud; the values
+        #-       are checked by _formatValues, the layout on the first row
+        if cloudStrs is not None:
+            firstLine = block[:block.find(b'\n')].decode()
+            if cloudStrs[0] != self._lineToCloud(firstLine)[1]:
+                cloudStrs = None
+        if cloudStrs is None:
+            for line in block.decode().splitlines():
+                self._formatLine(line)
+            return
+        #- '%g' switches to the exponent notation at |value| >= 10**prec, i.e.
+        #- possibly not at the same values as the (unknown) OpenFOAM precision:
+        #- rows with such values are copied as text
+        exponentRows = np.flatnonzero(np.any(np.abs(values) >= 10.0**self.writePrecision, 
+                                             axis=(1, 2)))
+        if exponentRows.size:
+            lines = block.decode().splitlines()
+            for i in exponentRows:
+                cloudStrs[i] = self._lineToCloud(lines[i])[1]
+        for tN, cloudStr in zip(timeNames, cloudStrs):
+            self._writeCloud(tN, cloudStr)
+
+    def _formatValues(self, values):
+        #- Cloud file contents of all rows of a block, formatted at once, and
+        #- checked by parsing them back; the precision is widened if values
+        #- are not reproduced (e.g. a uniform initial field in the first row),
+        #- None if more than 15 digits are needed
+        flat = values.ravel()
+        while True:
+            text = '\v'.join([self.cloudFmt]*len(values)) % tuple(flat)
+            written = np.fromstring(text, sep=' ')
+            lost = (written != flat) & ~(np.isnan(written) & np.isnan(flat))
+            if not lost.any():
+                return text.split('\v')
+            #- Shortest repr gives the digits needed by each value (first ones
+            #- only, the check is repeated anyway)
+            prec = max(self.writePrecision+1, 
+                       max(map(reprDigits, flat[lost][:1024].tolist())))
+            if prec > 15:
+                return None
+            self._setPrecision(prec)
+
+    def _parseBlock(self, block):
+        #- Time names and values, shaped (rows, probes, components), of a block
+        #- of rows; None for values if the block is malformed
+        rows = block.splitlines()
+        timeNames = []
+        valueRows = []
+        for row in rows:
+            tN, values = row.split(None, 1)
+            timeNames.append(tN.decode())
+            valueRows.append(values)
+        #- Strip parentheses in bulk and convert whole block to float array
+        values = np.fromstring(b' '.join(valueRows).translate(None, b'()').decode(), 
+                               dtype=float, sep=' ')
+        if values.size != len(rows)*self.nCoord*self.nv:
+            return timeNames, None
+        return timeNames, values.reshape((len(rows), self.nCoord, self.nv))
+
+    def _lineToCloud(self, line):
+        #- Time name and cloud file content of a probe file row
+        tN = line.split(None, 1)[0]
+        if self.nv == 1:
+            fieldStr = line.split()[1:]
+            cloudStr = '\n'.join(fieldStr)
+        elif self.nv > 1:
+            fieldStr = re.findall('\(([^)]+)', line)
+            cloudStr = ('\n'.join(fieldStr)).replace(' ', '\t')
+        return tN, cloudStr
+
+    def _writeCloud(self, tN, cloudStr):
         #- Use 'tN' as the directory name for the output file
         timeDIR = os.path.join(self.snapsDIR, tN)
         make_dir(timeDIR)
         #- Write to cloud file with each element in a new line
         cloudFILE = os.path.join(timeDIR, 'cloud_'+self.fieldNAME+'.xy')
         with open(cloudFILE, 'w') as fout:
-            if self.nv == 1:
-                fieldStr = line.split()[1:]
-                fout.write('\n'.join(fieldStr))
-            elif self.nv > 1:
-                fieldStr = re.findall('\(([^)]+)', line)
-                fout.write(('\n'.join(fieldStr)).replace(' ', '\t'))
+            fout.write(cloudStr)
+
+    def _getPrecision(self):
+        #- Infer the number of significant digits from the first data row
+        #- NOTE: OpenFOAM writes values as '%.<writePrecision>g'; the smallest
+        #-       precision reproducing every value of the row is used, and
+        #-       widened by _formatValues if a later row needs more digits.
+        if self.writePrecision is None and MPI_RANK == 0:
+            with open(self.fieldFILE, 'rb') as f:
+                f.seek(self.rowOffsets[0])
+                line = f.read(self.rowOffsets[1]-self.rowOffsets[0]).decode()
+            self.writePrecision = rowPrecision(line.translate(parenthesesToSpace).split()[1:])
+        self.writePrecision = comm.bcast(self.writePrecision, root=0)
+        self.cloudFmt = None
+        if self.writePrecision is not None:
+            self._setPrecision(self.writePrecision)
+
+    def _setPrecision(self, prec):
+        #- Format string of a cloud file
+        self.writePrecision = prec
+        valueFmt = '%.{0:d}g'.format(prec)
+        self.cloudFmt = '\n'.join(['\t'.join([valueFmt]*self.nv)]*self.nCoord)
 
     def _scatterTime(self):
-        #- Get number of time steps from number of lines in file
-        with open(self.fieldFILE, 'rb') as f:
-            self.nt = sum(1 for _ in f)-self.nHeader
+        #- Get number of time steps from number of data rows in index
+        self.nt = len(self.rowOffsets)-1
         if self.nt <= 0:
             print("WARNING: Nothing to read in {0}".format(self.fieldFILE))
             comm.abort()
-        #- Scatter time steps across processes    
-        if MPI_RANK == 0:
-            #- Determine the size of each sub-task
-            v, res = divmod(self.nt, MPI_SIZE)
-            taskSizePerRank = [v+1 if p<res else v for p in range(MPI_SIZE)]
-            #- Determine starting and ending indices of each sub-task
-            startIndPerTask = [sum(taskSizePerRank[:p]) for p in range(MPI_SIZE)]
-            endIndPerTask = [sum(taskSizePerRank[:p+1]) for p in range(MPI_SIZE)]
-            #- Split full time list into sub-list
-            timeInd = np.arange(self.nt).tolist()
-            self.timeIndPerRank = [timeInd[startIndPerTask[p]:endIndPerTask[p]] \
-                                    for p in range(MPI_SIZE)]
-            #-
-            ntPerRank = [len(tList) for tList in self.timeIndPerRank]
-            # print(# "Rank   : ", MPI_RANK, '\n'
-            #       "subDIR : ", os.path.basename(os.path.normpath(self.probesSUBDIR)), '\n'
-            #       "Field  : ", self.fieldNAME, '\n'
-            #       "Value  : ", ntPerRank, "=", sum(ntPerRank), "of", self.nt)
-        else:
-            self.timeIndPerRank = None
-        self.timeIndPerRank = comm.scatter(self.timeIndPerRank, root=0)
+        #- Distribute chunks of consecutive time steps on request
+        #- NOTE: Ranks slowed down (e.g. by a busy storage target) take fewer chunks
+        self.scheduler = taskScheduler(comm, self.nt)
 
 # ---------------------------------------------------------------------------
 # MAIN FUNCTION
@@ -222,6 +394,32 @@ def main():
                     help="Output coordinates file", 
                     nargs='?', 
                     type=str)
+    CLI.add_argument('-m', '--readMode', 
+                    help="Probe file reading: seek to byte range per rank "
+                         "(stream) or re-read file per time step (islice)", 
+                    nargs='?', 
+                    type=str,
+                    choices=['stream', 'islice'],
+                    default='stream')
+    CLI.add_argument('-r', '--parser', 
+                    help="Row parsing in stream mode: row-wise copy of the value "
+                         "tokens (text) or block-wise conversion to floats (array)", 
+                    nargs='?', 
+                    type=str,
+                    choices=['text', 'array'],
+                    default='text')
+    CLI.add_argument('-o', '--outFormat', 
+                    help="Output: time directories of cloud files (dirs) or "
+                         "binary snapshot store <snapsDIR>.store (store)", 
+                    nargs='?', 
+                    type=str,
+                    choices=['dirs', 'store'],
+                    default='dirs')
+    CLI.add_argument('-w', '--writePrecision', 
+                    help="Significant digits of probe values, as 'writePrecision' "
+                         "in controlDict (optional, inferred if not given)", 
+                    nargs='?', 
+                    type=int)
     try:
         args = CLI.parse_args()
     except SystemExit:
@@ -229,7 +427,12 @@ def main():
         quit()
     p = splitProbe2TimeDir(args.probesSUBDIR,
                            args.fieldNAME,
-                           args.coordFILE)
+                           args.coordFILE,
+                           args.readMode,
+                           args.parser,
+                           args.writePrecision,
+                           args.outFormat)
+    p.getIndex()
     p.getCoordinates()
     p.getCloud()
 
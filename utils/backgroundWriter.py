@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Background writer
+    Calls writeFn(*args) in a thread for the arguments queued with put(), so
+    that writing overlaps the computation; the bounded queue limits memory.
+"""
+
+import queue
+import threading
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class backgroundWriter():
+    def __init__(self, writeFn, depth=2):
+        self.writeFn = writeFn
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self.worker = threading.Thread(target=self._write, daemon=True)
+        self.worker.start()
+
+    def put(self, *args):
+        #- NOTE: The arguments must not be modified until written
+        if self.error is not None:
+            raise self.error
+        self.queue.put(args)
+
+    def close(self):
+        #- Wait until all queued items are written
+        self.queue.put(None)
+        self.worker.join()
+        if self.error is not None:
+            raise self.error
+
+    def _write(self):
+        while True:
+            args = self.queue.get()
+            if args is None:
+                return
+            #- Keep consuming after an error so that put() never blocks
+            if self.error is None:
+                try:
+                    self.writeFn(*args)
+                except Exception as e:
+                    self.error = e
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Appendable log of POD temporal coefficients
+    chronos.json - fields and number of coefficients per field
+    time.bin     - float64, time of each record
+    <field>.bin  - float64, coefficients of each record, shape (nRecords, nModes)
+    Field rows are written before their times, so a record exists once its time
+    is on disk; rows left by an interrupted write are dropped when reopened.
+    chronosTail returns the records appended since its last poll, to follow
+    the log of a running solver.
+RUN:
+    $ python chronosLog.py $chronosDIR
+"""
+
+import numpy as np
+import json
+import os
+import sys
+from pathlib import Path
+
+# ---------------------------------------------------------------------------
+# UTILITY FUNCTION(S)
+# ---------------------------------------------------------------------------
+def nRecords(fileNAME, recordSize):
+    #- Number of complete float64 records in a file
+    if not os.path.isfile(fileNAME):
+        return 0
+    return os.path.getsize(fileNAME)//(8*recordSize)
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class chronosWriter():
+    def __init__(self, chronosDIR, fieldNames, nModes, flushEvery=100):
+        self.chronosDIR = chronosDIR
+        self.fieldNames = list(fieldNames)
+        self.nModes = nModes
+        self.flushEvery = flushEvery
+        Path(chronosDIR).mkdir(parents=True, exist_ok=True)
+
+        #- Continue an existing log of the same layout, otherwise start a new one
+        meta = {'format': 'chronosLog',
+                'version': 1,
+                'dtype': '<f8',
+                'fields': self.fieldNames,
+                'nModes': self.nModes}
+        nRec = 0
+        if chronosReader.isLog(chronosDIR):
+            with open(os.path.join(chronosDIR, 'chronos.json')) as f:
+                oldMeta = json.load(f)
+            if oldMeta['fields'] == meta['fields'] and oldMeta['nModes'] == meta['nModes']:
+                nRec = nRecords(os.path.join(chronosDIR, 'time.bin'), 1)
+            else:
+                print("WARNING: Overwriting chronos log {0} of different layout".format(chronosDIR))
+        self._saveMeta(meta)
+
+        #- Drop uncommitted rows
+        self.files = {}
+        for name, recordSize in [('time', 1)]+[(fld, nModes) for fld in self.fieldNames]:
+            f = open(os.path.join(chronosDIR, name+'.bin'), 'a+b')
+            f.truncate(nRec*8*recordSize)
+            self.files[name] = f
+        self.times = []
+        self.coeffs = {fld: [] for fld in self.fieldNames}
+
+    def append(self, t, coeffs):
+        #- Coefficients of all fields at time t, in the order of `fieldNames`
+        #- NOTE: Copied, so that the caller may reuse its buffers
+        for fld, coeff in zip(self.fieldNames, coeffs):
+            self.coeffs[fld].append(np.array(coeff, dtype=float).ravel())
+        self.times.append(t)
+        if len(self.times) >= self.flushEvery:
+            self.flush()
+
+    def flush(self):
+        if not self.times:
+            return
+        for fld in self.fieldNames:
+            self._write(self.files[fld], np.stack(self.coeffs[fld]))
+            self.coeffs[fld] = []
+        #- Commit the records
+        self._write(self.files['time'], np.array(self.times, dtype=float))
+        self.times = []
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+    def _write(self, f, data):
+        f.write(data.astype('<f8').tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _saveMeta(self, meta):
+        metaFILE = os.path.join(self.chronosDIR, 'chronos.json')
+        tmpFILE = metaFILE+'.tmp'
+        with open(tmpFILE, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmpFILE, metaFILE)
+
+class chronosReader():
+    def __init__(self, chronosDIR):
+        self.chronosDIR = chronosDIR
+        with open(os.path.join(chronosDIR, 'chronos.json')) as f:
+            meta = json.load(f)
+        self.fieldNames = meta['fields']
+        self.nModes = meta['nModes']
+
+        #- Committed records; field rows are written first
+        nRec = min([nRecords(os.path.join(chronosDIR, 'time.bin'), 1)]+
+                   [nRecords(os.path.join(chronosDIR, fld+'.bin'), self.nModes)
+                    for fld in self.fieldNames])
+        times = np.fromfile(os.path.join(chronosDIR, 'time.bin'), dtype='<f8', count=nRec)
+        #- Sorted times, keeping the last record of repeated times
+        #- (implicit coupling iterations, restarts)
+        self.times, lastInd = np.unique(times[::-1], return_index=True)
+        self.recordInd = nRec-1-lastInd
+        self.nRec = nRec
+
+    @staticmethod
+    def isLog(chronosDIR):
+        return os.path.isfile(os.path.join(chronosDIR, 'chronos.json'))
+
+    def read(self, fieldNAME, timeInd=None):
+        #- Coefficients (nt, nModes) at the (sorted) times of index `timeInd`
+        if self.nRec == 0:
+            return np.empty((0, self.nModes))
+        coeffs = np.memmap(os.path.join(self.chronosDIR, fieldNAME+'.bin'),
+                           dtype='<f8', mode='r', shape=(self.nRec, self.nModes))
+        recordInd = self.recordInd if timeInd is None else self.recordInd[timeInd]
+        return np.asarray(coeffs[recordInd])
+
+class chronosTail():
+    def __init__(self, chronosDIR):
+        #- Records appended to a log (e.g. by a running solver) since the last poll
+        #- NOTE: Only the new bytes of the files are read, so the cost of a poll
+        #-       does not grow with the length of the log
+        self.chronosDIR = chronosDIR
+        self.nRec = 0
+        self._loadMeta()
+
+    def poll(self):
+        #- Times (n,) and coefficients {field: (n, nModes)} of the new records,
+        #- in the order written; of repeated times the last record is kept
+        if self._metaChanged():
+            #- Writer restarted: the records are kept if the layout is unchanged
+            layout = (self.fieldNames, self.nModes)
+            self._loadMeta()
+            if (self.fieldNames, self.nModes) != layout:
+                print("WARNING: Chronos log {0} restarted with a new layout".format(self.chronosDIR))
+                self.nRec = 0
+        nRec = min([nRecords(os.path.join(self.chronosDIR, 'time.bin'), 1)]+
+                   [nRecords(os.path.join(self.chronosDIR, fld+'.bin'), self.nModes)
+                    for fld in self.fieldNames])
+        if nRec < self.nRec:
+            print("WARNING: Chronos log {0} truncated".format(self.chronosDIR))
+            self.nRec = 0
+        n0 = self.nRec
+        nNew = nRec-n0
+        if nNew <= 0:
+            return np.empty(0), {fld: np.empty((0, self.nModes)) for fld in self.fieldNames}
+        times = np.fromfile(os.path.join(self.chronosDIR, 'time.bin'), dtype='<f8',
+                            count=nNew, offset=8*n0)
+        coeffs = {fld: np.fromfile(os.path.join(self.chronosDIR, fld+'.bin'), dtype='<f8',
+                                   count=nNew*self.nModes,
+                                   offset=8*n0*self.nModes).reshape((nNew, self.nModes))
+                  for fld in self.fieldNames}
+        self.nRec = nRec
+        #- Last record of each time (implicit coupling iterations)
+        _, lastInd = np.unique(times[::-1], return_index=True)
+        keep = np.sort(nNew-1-lastInd)
+        return times[keep], {fld: c[keep] for fld, c in coeffs.items()}
+
+    def _loadMeta(self):
+        metaFILE = os.path.join(self.chronosDIR, 'chronos.json')
+        with open(metaFILE) as f:
+            meta = json.load(f)
+        self.fieldNames = meta['fields']
+        self.nModes = meta['nModes']
+        self.metaStat = os.stat(metaFILE).st_mtime_ns
+
+    def _metaChanged(self):
+        #- NOTE: The writer rewrites chronos.json when (re)started
+        return os.stat(os.path.join(self.chronosDIR, 'chronos.json')).st_mtime_ns != self.metaStat
+
+# ---------------------------------------------------------------------------
+# MAIN FUNCTION
+# ---------------------------------------------------------------------------
+def main():
+    #- Read arguments
+    #- NOTE: sys.argv[0] is always the script name
+    for chronosDIR in sys.argv[1:]:
+        log = chronosReader(chronosDIR)
+        print('{0}: fields={1}, modes={2}, records={3}, times={4}'.format(
+              chronosDIR, log.fieldNames, log.nModes, log.nRec, len(log.times)))
+        if len(log.times) > 0:
+            print('    t = {0:.12g} ... {1:.12g}'.format(log.times[0], log.times[-1]))
+
+# ---------------------------------------------------------------------------
+# COMMAND LINE EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
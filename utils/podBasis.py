@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Memory-mapped access to POD output
+    mode.bin    (nModes, nv*nPts) float64, components stacked per mode as
+                [x(0..nPts-1), y(0..nPts-1), z(0..nPts-1)]
+    chronos.bin (nt, nModes) float64
+"""
+
+import numpy as np
+import os
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class podBasis():
+    def __init__(self, modesDIR, nPts, nv):
+        self.modeFILE = os.path.join(modesDIR, 'mode.bin')
+        self.nPts = nPts
+        self.nv = nv
+
+        #- Number of modes in file
+        nValues = os.path.getsize(self.modeFILE)//np.dtype(float).itemsize
+        self.nModes, res = divmod(nValues, self.nPts*self.nv)
+        if res != 0 or self.nModes == 0:
+            raise ValueError("Size of {0} does not match nPts={1}, nv={2}".format(
+                             self.modeFILE, nPts, nv))
+
+        #- NOTE: Read-only map; pages are only read when accessed
+        self.raw = np.memmap(self.modeFILE, dtype=float, mode='r',
+                             shape=(self.nModes, self.nv*self.nPts))
+
+    def modes(self, modeRange=None, pointInd=None):
+        #- Modes as (mode, point, component)
+        #- NOTE: A view of the file unless a point index set is given, in which
+        #-       case only the selected points are copied
+        m0, m1 = self._modeRange(modeRange)
+        modes = self.raw[m0:m1].reshape((m1-m0, self.nv, self.nPts))
+        if pointInd is not None:
+            modes = modes[:, :, np.asarray(pointInd)]
+        return modes.transpose((0, 2, 1))
+
+    def matrix(self, modeRange=None, pointInd=None):
+        #- Modes as columns of a (nv*nPts, nModes) matrix, components stacked
+        #- as in mode.bin; e.g. for the modes at indices `ind` of a vector field
+        #- the rows are [ind, ind+nPts, ind+2*nPts] of the full matrix
+        m0, m1 = self._modeRange(modeRange)
+        if pointInd is None:
+            return self.raw[m0:m1].T
+        modes = self.raw[m0:m1].reshape((m1-m0, self.nv, self.nPts))
+        modes = modes[:, :, np.asarray(pointInd)]
+        return modes.reshape((m1-m0, -1)).T
+
+    def _modeRange(self, modeRange):
+        if modeRange is None:
+            return 0, self.nModes
+        m0, m1 = modeRange
+        if not 0 <= m0 < m1 <= self.nModes:
+            raise ValueError("Mode range {0} outside of [0, {1}]".format(
+                             modeRange, self.nModes))
+        return m0, m1
+
+def loadChronos(chronosDIR, nModes=None, nt=None):
+    #- Memory-mapped temporal coefficients (nt, nModes); one of the sizes is needed
+    chronosFILE = os.path.join(chronosDIR, 'chronos.bin')
+    nValues = os.path.getsize(chronosFILE)//np.dtype(float).itemsize
+    if nModes is None:
+        nModes = nValues//nt
+    if nt is None:
+        nt = nValues//nModes
+    if nt*nModes != nValues:
+        raise ValueError("Size of {0} does not match nt={1}, nModes={2}".format(
+                         chronosFILE, nt, nModes))
+    return np.memmap(chronosFILE, dtype=float, mode='r', shape=(nt, nModes))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Background prefetch of snapshots
+    A reader thread loads the next `depth` times ahead of the consumer into a
+    bounded queue, so that file I/O is off the critical path of a time loop.
+"""
+
+import queue
+import threading
+import time
+
+from snapshotStore import timeName
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class snapshotPrefetcher():
+    def __init__(self, readFn, depth=4):
+        #- readFn(t) returns the snapshot at time t
+        self.readFn = readFn
+        self.depth = depth
+        self.worker = None
+
+        #- Last snapshot returned (repeated requests, e.g. implicit coupling)
+        self.lastName = None
+        self.lastData = None
+
+        #- Counters
+        self.nHits = 0
+        self.nStalls = 0
+        self.nMisses = 0
+        self.stallTime = 0.0
+
+    def start(self, times):
+        #- (Re)start reading the (possibly infinite) sequence `times`
+        self.stop()
+        self.queue = queue.Queue(maxsize=self.depth)
+        self.stopEvent = threading.Event()
+        self.worker = threading.Thread(target=self._read, args=(iter(times),), daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        if self.worker is None:
+            return
+        self.stopEvent.set()
+        #- Unblock a reader waiting on a full queue
+        while self.worker.is_alive():
+            try:
+                self.queue.get(timeout=0.01)
+            except queue.Empty:
+                pass
+        self.worker.join()
+        self.worker = None
+
+    def get(self, t, times=None):
+        #- Snapshot at time t
+        #- NOTE: Times queued before t are dropped. If t is not queued it is read
+        #-       here (a miss) and prefetching restarts from `times`, if given.
+        name = timeName(t)
+        if name == self.lastName:
+            return self.lastData
+        data = None
+        isStalled = False
+        while self.worker is not None:
+            if self.queue.empty():
+                #- Count each request that waits once
+                self.nStalls += not isStalled
+                isStalled = True
+                tic = time.perf_counter()
+                item = self.queue.get()
+                self.stallTime += time.perf_counter()-tic
+            else:
+                item = self.queue.get()
+            qName, qData, qError = item
+            if qName is None or float(qName) > float(name):
+                #- End of sequence, or t was skipped
+                break
+            if qName == name:
+                if qError is not None:
+                    raise qError
+                self.nHits += 1
+                data = qData
+                break
+        if data is None:
+            self.nMisses += 1
+            self.stop()
+            data = self.readFn(t)
+            if times is not None:
+                self.start(times)
+        self.lastName = name
+        self.lastData = data
+        return data
+
+    def stats(self):
+        return "prefetch depth={0}: hits={1}, misses={2}, stalls={3} ({4:.3f} s)".format(
+               self.depth, self.nHits, self.nMisses, self.nStalls, self.stallTime)
+
+    def _read(self, times):
+        for t in times:
+            if self.stopEvent.is_set():
+                return
+            try:
+                item = (timeName(t), self.readFn(t), None)
+            except Exception as e:
+                #- Raised only if this time is requested
+                self.queue.put((timeName(t), None, e))
+                break
+            self.queue.put(item)
+        self.queue.put((None, None, None))
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Binary snapshot store
+    Alternative to the time directories of `cloud_<fields>.xy` files: one
+    memory-mappable binary array per field, with a time index and a
+    coordinates block.
+    Readers optionally drop masked points (see pod/preProcessing/createMask.py)
+    when a snapshot is read, instead of rewriting the snapshot files.
+LAYOUT:
+    <storeDIR>/store.json       number of points, and per field: size, times
+    <storeDIR>/coordinates.bin  (nPts, 3) float64
+    <storeDIR>/<field>.bin      (nt, nPts, nv) float64, C-order
+RUN (convert time directories to store):
+    $ python utils/snapshotStore.py -i $snapsDIR [-o $storeDIR] [-f p U] [-c $coordFILE] \
+        [-m $maskFILE]
+"""
+
+import numpy as np
+import pandas as po
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------------------------------------------------------------------------
+# UTILITY FUNCTION(S)
+# ---------------------------------------------------------------------------
+#- Variable types
+scaList=["p", "p_rgh", "T", "Tprime", "k", "kSGS", "kSGSmean",
+         "kappat", "nuSgs", "nuSGSmean", "nut", "nuTilda", "omega"]
+vecList=["U", "Uprime"]
+tenList=["Rmean"]
+
+#- Number of components of a field
+def fieldSize(fieldNAME):
+    if fieldNAME in scaList:
+        return 1
+    if fieldNAME in vecList:
+        return 3
+    if fieldNAME in tenList:
+        return 6
+    raise KeyError("Field size not assigned for {0}!".format(fieldNAME))
+
+#- Fields contained in a cloud file, e.g. cloud_p_k_omega_nut.xy -> [p, k, omega, nut]
+#- NOTE: Field names containing '_' (e.g. p_rgh) are matched greedily
+def cloudFields(fileNAME):
+    words = os.path.splitext(os.path.basename(fileNAME))[0].split('_')[1:]
+    knownList = scaList+vecList+tenList
+    fields = []
+    i = 0
+    while i < len(words):
+        if i+1 < len(words) and words[i]+'_'+words[i+1] in knownList:
+            fields.append(words[i]+'_'+words[i+1])
+            i += 2
+        else:
+            fields.append(words[i])
+            i += 1
+    return fields
+
+#- Read coordinates from a pointCloud.xy (x y z) or pointCloud.dat (( x y z )) file
+def readCoordFile(coordFILE):
+    useInd = [1,2,3] if coordFILE.endswith('.dat') else [0,1,2]
+    return po.read_csv(coordFILE,
+                       delim_whitespace=True,
+                       header=None,
+                       usecols=useInd).to_numpy()
+
+#- Numerical time directories sorted by time
+def listTimeDirs(snapsDIR):
+    timeNames = []
+    for name in os.listdir(snapsDIR):
+        try:
+            float(name)
+        except ValueError:
+            continue
+        if os.path.isdir(os.path.join(snapsDIR, name)):
+            timeNames.append(name)
+    return sorted(timeNames, key=float)
+
+#- Time directory name of a time given as string or number
+def timeName(t):
+    return t if isinstance(t, str) else '{0:.12g}'.format(t)
+
+#- Index of the points kept by a boolean mask file (True for masked points),
+#- cached while the file is unchanged
+maskCache = {}
+def loadMask(maskFILE):
+    maskFILE = os.path.abspath(maskFILE)
+    stat = os.stat(maskFILE)
+    key = (maskFILE, stat.st_mtime_ns, stat.st_size)
+    if key not in maskCache:
+        mask = np.load(maskFILE)
+        if mask.dtype != bool or mask.ndim != 1:
+            raise ValueError("Mask {0} is not a 1D boolean array".format(maskFILE))
+        maskCache[key] = (len(mask), np.flatnonzero(~mask))
+    return maskCache[key]
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class snapshotStore():
+    def __init__(self, storeDIR):
+        self.storeDIR = os.path.abspath(storeDIR)
+        self.metaFILE = os.path.join(self.storeDIR, 'store.json')
+        self.coordFILE = os.path.join(self.storeDIR, 'coordinates.bin')
+        self.dtype = np.dtype('<f8')
+        self.meta = {'format': 'snapshotStore', 'version': 1,
+                     'dtype': self.dtype.str, 'nPts': None, 'fields': {}}
+        if os.path.isfile(self.metaFILE):
+            with open(self.metaFILE) as f:
+                self.meta = json.load(f)
+        #- Per field: row lookup and memory map, rebuilt when times are added
+        self.rowIndex = {}
+        self.maps = {}
+
+    @staticmethod
+    def isStore(storeDIR):
+        return os.path.isfile(os.path.join(storeDIR, 'store.json'))
+
+    @property
+    def nPts(self):
+        return self.meta['nPts']
+
+    @property
+    def fields(self):
+        return list(self.meta['fields'].keys())
+
+    def fieldSize(self, fieldNAME):
+        return self.meta['fields'][fieldNAME]['nv']
+
+    def timeNames(self, fieldNAME):
+        return self.meta['fields'][fieldNAME]['times']
+
+    def times(self, fieldNAME):
+        return np.array(self.timeNames(fieldNAME), dtype=float)
+
+    def timeIndex(self, fieldNAME, t):
+        #- Row of a time given as directory name or number
+        rowOf, sortedTimes, sortedRows = self._rowIndex(fieldNAME)
+        if isinstance(t, str) and t in rowOf:
+            return rowOf[t]
+        #- Nearest time within 1e-9
+        i = np.searchsorted(sortedTimes, float(t))
+        for j in [i-1, i]:
+            if 0 <= j < len(sortedTimes) and abs(sortedTimes[j]-float(t)) <= 1e-9:
+                return int(sortedRows[j])
+        raise KeyError("Time {0} of {1} not in {2}".format(t, fieldNAME, self.storeDIR))
+
+    def read(self, fieldNAME, mode='r'):
+        #- Memory-mapped array (nt, nPts, nv) of a field
+        #- NOTE: The map is kept and reused while the times of the field are unchanged
+        if fieldNAME not in self.meta['fields']:
+            raise KeyError("Field {0} not in {1}".format(fieldNAME, self.storeDIR))
+        shape = (len(self.timeNames(fieldNAME)), self.nPts, self.fieldSize(fieldNAME))
+        if shape[0] == 0:
+            return np.empty(shape, dtype=self.dtype)
+        key = (fieldNAME, mode)
+        if key not in self.maps or self.maps[key].shape != shape:
+            self.maps[key] = np.memmap(self._fieldFILE(fieldNAME), dtype=self.dtype,
+                                       mode=mode, shape=shape)
+        return self.maps[key]
+
+    def readTime(self, fieldNAME, t):
+        #- Field (nPts, nv) at a time given as directory name or number
+        return self.read(fieldNAME)[self.timeIndex(fieldNAME, t)]
+
+    def readCoord(self):
+        if not os.path.isfile(self.coordFILE):
+            return None
+        return np.fromfile(self.coordFILE, dtype=self.dtype).reshape((-1, 3))
+
+    def writeCoord(self, coord):
+        coord = np.ascontiguousarray(coord, dtype=self.dtype)
+        self._setPoints(coord.shape[0])
+        os.makedirs(self.storeDIR, exist_ok=True)
+        coord.tofile(self.coordFILE)
+        self._saveMeta()
+
+    def setMask(self, maskFILE, nPtsAll):
+        #- Record that the store holds only the points kept by a mask
+        self.meta['mask'] = {'file': os.path.abspath(maskFILE), 'nPtsAll': int(nPtsAll)}
+        self._saveMeta()
+
+    def reserve(self, fieldNAME, nv, nPts, timeNames):
+        #- Rows of the given times, appending new times at the end of the field
+        #- NOTE: Existing times are overwritten in place (e.g. overlapping restarts)
+        self._setPoints(nPts)
+        os.makedirs(self.storeDIR, exist_ok=True)
+        fld = self.meta['fields'].setdefault(fieldNAME, {'nv': nv, 'times': []})
+        if fld['nv'] != nv:
+            raise ValueError("Field {0} has {1} components, not {2}".format(
+                             fieldNAME, fld['nv'], nv))
+        rowOf = {name: i for i, name in enumerate(fld['times'])}
+        rows = []
+        for name in timeNames:
+            if name not in rowOf:
+                rowOf[name] = len(fld['times'])
+                fld['times'].append(name)
+            rows.append(rowOf[name])
+        #- Extend the binary file (zero-filled)
+        rowBytes = nPts*nv*self.dtype.itemsize
+        with open(self._fieldFILE(fieldNAME), 'ab') as f:
+            f.truncate(len(fld['times'])*rowBytes)
+        self._saveMeta()
+        return np.array(rows, dtype=np.int64)
+
+    def write(self, fieldNAME, rows, data):
+        #- Write data (len(rows), nPts, nv) to the given rows
+        #- NOTE: Positional writes of contiguous runs of rows, so that several
+        #-       processes can fill disjoint rows of the same field
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        rowBytes = self.nPts*self.fieldSize(fieldNAME)*self.dtype.itemsize
+        data = data.reshape((len(rows), -1))
+        runStart = np.flatnonzero(np.diff(rows, prepend=-2) != 1)
+        runEnd = np.append(runStart[1:], len(rows))
+        with open(self._fieldFILE(fieldNAME), 'r+b') as f:
+            for i0, i1 in zip(runStart, runEnd):
+                f.seek(int(rows[i0])*rowBytes)
+                f.write(data[i0:i1].tobytes())
+
+    def _fieldFILE(self, fieldNAME):
+        return os.path.join(self.storeDIR, fieldNAME+'.bin')
+
+    def _rowIndex(self, fieldNAME):
+        #- Row of each time name, and times sorted numerically with their rows
+        #- NOTE: Built once per field; times are only ever appended (reserve)
+        names = self.timeNames(fieldNAME)
+        if fieldNAME not in self.rowIndex or self.rowIndex[fieldNAME][0] != len(names):
+            times = np.array(names, dtype=float)
+            order = np.argsort(times, kind='stable')
+            self.rowIndex[fieldNAME] = (len(names), 
+                                        {name: i for i, name in reversed(list(enumerate(names)))},
+                                        times[order], order)
+        return self.rowIndex[fieldNAME][1:]
+
+    def _setPoints(self, nPts):
+        if self.meta['nPts'] is None:
+            self.meta['nPts'] = int(nPts)
+        elif self.meta['nPts'] != nPts:
+            raise ValueError("Store {0} has {1} points, not {2}".format(
+                             self.storeDIR, self.meta['nPts'], nPts))
+
+    def _saveMeta(self):
+        #- Write to a temporary file first so that readers never see partial metadata
+        tmpFILE = self.metaFILE+'.tmp'
+        with open(tmpFILE, 'w') as f:
+            json.dump(self.meta, f, indent=4)
+        os.replace(tmpFILE, self.metaFILE)
+
+class snapshotReader():
+    #- Read snapshots of a field at a time from a snapshot store, if found at
+    #- `snapsDIR` or `<snapsDIR>.store`, else from the time directories
+    #- NOTE: With a mask file, only the points kept by the mask are returned
+    def __init__(self, snapsDIR, useStore=True, maskFILE=None):
+        self.snapsDIR = os.path.abspath(snapsDIR)
+        self.maskFILE = maskFILE
+        self.nPtsAll, self.keepInd = loadMask(maskFILE) if maskFILE else (None, None)
+        self.store = None
+        for storeDIR in [self.snapsDIR, self.snapsDIR+'.store']:
+            if useStore and snapshotStore.isStore(storeDIR):
+                self.store = snapshotStore(storeDIR)
+                break
+        #- A store converted with a mask (-m) already holds only the kept points
+        self.storeMasked = False
+        if self.store is not None and self.store.nPts is not None and self.keepInd is not None:
+            if 'mask' in self.store.meta or self.store.nPts != self.nPtsAll:
+                if self.store.nPts != len(self.keepInd):
+                    raise ValueError("Store {0} has {1} points, mask {2} keeps {3} of {4}".format(
+                                     self.store.storeDIR, self.store.nPts, maskFILE, 
+                                     len(self.keepInd), self.nPtsAll))
+                self.storeMasked = True
+        #- Cloud file and columns of each field in the time directories
+        self.cloudLayout = {}
+
+    def read(self, t, fieldNAME):
+        #- Field (nPts, nv) at a time given as directory name or number
+        if self.store is not None and fieldNAME in self.store.fields:
+            try:
+                return self.applyStoreMask(self.store.readTime(fieldNAME, t))
+            except KeyError:
+                pass
+        timeDIR = os.path.join(self.snapsDIR, timeName(t))
+        cloudFILE, useInd = self._locate(timeDIR, fieldNAME)
+        return self.applyMask(po.read_csv(os.path.join(timeDIR, cloudFILE),
+                                          header=None,
+                                          delim_whitespace=True,
+                                          comment='#',
+                                          usecols=useInd).to_numpy())
+
+    def readFields(self, t, fieldNames):
+        #- Fields {name: (nPts, nv)} at a time; a cloud file is parsed once for
+        #- all the requested fields it contains
+        data = {}
+        cloudFields = {}
+        timeDIR = os.path.join(self.snapsDIR, timeName(t))
+        for fld in fieldNames:
+            if self.store is not None and fld in self.store.fields:
+                try:
+                    data[fld] = self.applyStoreMask(self.store.readTime(fld, t))
+                    continue
+                except KeyError:
+                    pass
+            cloudFILE, _ = self._locate(timeDIR, fld)
+            cloudFields.setdefault(cloudFILE, []).append(fld)
+        for cloudFILE, fields in cloudFields.items():
+            #- NOTE: Columns are returned in file order
+            useInd = sorted(set(c for fld in fields for c in self.cloudLayout[fld][1]))
+            values = po.read_csv(os.path.join(timeDIR, cloudFILE),
+                                 header=None,
+                                 delim_whitespace=True,
+                                 comment='#',
+                                 usecols=useInd).to_numpy()
+            values = self.applyMask(values)
+            for fld in fields:
+                data[fld] = values[:, [useInd.index(c) for c in self.cloudLayout[fld][1]]]
+        return data
+
+    def readMany(self, times, fieldNAME, out=None, nWorkers=None):
+        #- Field at several times as (nt, nv, nPts), components stacked as in
+        #- the POD files; the snapshots are read in a thread pool
+        #- NOTE: Each snapshot is copied into `out` (e.g. a memory-mapped array)
+        #-       by the thread that read it, if given
+        if out is None:
+            with ThreadPoolExecutor(nWorkers) as pool:
+                return np.stack(list(pool.map(lambda t: self.read(t, fieldNAME).T, times)))
+        def readInto(i):
+            out[i] = self.read(times[i], fieldNAME).T
+        with ThreadPoolExecutor(nWorkers) as pool:
+            list(pool.map(readInto, range(len(times))))
+        return out
+
+    def readCoord(self, t=None):
+        #- Coordinates (nPts, 3) of the store, or of the cloud files at time t
+        #- containing them; None if not available
+        if self.store is not None:
+            coord = self.store.readCoord()
+            if coord is not None:
+                return self.applyStoreMask(coord)
+        if t is None:
+            t = listTimeDirs(self.snapsDIR)[0]
+        timeDIR = os.path.join(self.snapsDIR, timeName(t))
+        for cloudFILE in sorted(os.listdir(timeDIR)):
+            if cloudFILE.startswith('cloud_') and self._hasCoord(timeDIR, cloudFILE):
+                return self.applyMask(po.read_csv(os.path.join(timeDIR, cloudFILE),
+                                                  header=None,
+                                                  delim_whitespace=True,
+                                                  comment='#',
+                                                  usecols=[0,1,2]).to_numpy())
+        return None
+
+    def applyMask(self, data):
+        #- Points (rows) of the data kept by the mask
+        #- NOTE: Only the kept rows of a memory-mapped array are read
+        if self.keepInd is None:
+            return np.asarray(data)
+        if data.shape[0] != self.nPtsAll:
+            raise ValueError("Mask {0} has {1} points, snapshot has {2}".format(
+                             self.maskFILE, self.nPtsAll, data.shape[0]))
+        return data[self.keepInd]
+
+    def applyStoreMask(self, data):
+        #- Data of the store, masked unless the store was written with the mask
+        if self.storeMasked:
+            return np.asarray(data)
+        return self.applyMask(data)
+
+    def timeNames(self, fieldNAME):
+        if self.store is not None and fieldNAME in self.store.fields:
+            return self.store.timeNames(fieldNAME)
+        return listTimeDirs(self.snapsDIR)
+
+    def _locate(self, timeDIR, fieldNAME):
+        #- Cloud file containing the field and its column indices
+        #- NOTE: The layout of the first time directory is used for all times
+        if fieldNAME not in self.cloudLayout:
+            for cloudFILE in sorted(os.listdir(timeDIR)):
+                if not cloudFILE.startswith('cloud_'):
+                    continue
+                fields = cloudFields(cloudFILE)
+                if fieldNAME not in fields:
+                    continue
+                colStart = 3 if self._hasCoord(timeDIR, cloudFILE) else 0
+                for fld in fields:
+                    nv = fieldSize(fld)
+                    self.cloudLayout[fld] = (cloudFILE, list(range(colStart, colStart+nv)))
+                    colStart += nv
+                break
+            else:
+                raise FileNotFoundError("Field {0} not found in {1}".format(fieldNAME, timeDIR))
+        return self.cloudLayout[fieldNAME]
+
+    def _hasCoord(self, timeDIR, cloudFILE):
+        #- Cloud files of OpenFOAM sets start with 3 coordinate columns
+        with open(os.path.join(timeDIR, cloudFILE)) as f:
+            line = f.readline()
+            while line.startswith('#'):
+                line = f.readline()
+        nCol = len(line.split())
+        return nCol == sum(fieldSize(fld) for fld in cloudFields(cloudFILE))+3
+
+def convertTimeDirs(snapsDIR, storeDIR, fieldNAMES=None, timeNames=None, coordFILE=None,
+                    maskFILE=None):
+    #- Convert time directories of cloud files to a snapshot store, keeping
+    #- only the points not masked (if a mask file is given)
+    reader = snapshotReader(snapsDIR, useStore=False, maskFILE=maskFILE)
+    if timeNames is None:
+        timeNames = listTimeDirs(snapsDIR)
+    if fieldNAMES is None:
+        fieldNAMES = []
+        for cloudFILE in sorted(os.listdir(os.path.join(snapsDIR, timeNames[0]))):
+            if cloudFILE.startswith('cloud_'):
+                fieldNAMES += cloudFields(cloudFILE)
+    store = snapshotStore(storeDIR)
+    #- Coordinates
+    coord = reader.applyMask(readCoordFile(coordFILE)) if coordFILE \
+            else reader.readCoord(timeNames[0])
+    if coord is not None:
+        store.writeCoord(coord)
+    #- Fields
+    for fld in fieldNAMES:
+        data = reader.read(timeNames[0], fld)
+        nPts, nv = data.shape
+        rows = store.reserve(fld, nv, nPts, timeNames)
+        print("Converting {0}: {1} times".format(fld, len(timeNames)))
+        for row, t in zip(rows, timeNames):
+            store.write(fld, [row], reader.read(t, fld)[None, :, :])
+    if maskFILE:
+        store.setMask(maskFILE, reader.nPtsAll)
+    return store
+
+# ---------------------------------------------------------------------------
+# MAIN FUNCTION
+# ---------------------------------------------------------------------------
+def main():
+    #- Read arguments
+    CLI = argparse.ArgumentParser(description='Convert time directories to snapshot store')
+    CLI.add_argument('-i', '--snapsDIR',
+                    help="Input directory containing time directories of cloud files",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-o', '--storeDIR',
+                    help="Output store directory (default: <snapsDIR>.store)",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-f', '--fields',
+                    help="Field names (default: all fields found)",
+                    nargs='*',
+                    type=str)
+    CLI.add_argument('-t', '--timeList',
+                    help="File listing the time directories to convert (optional)",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-c', '--coordFILE',
+                    help="Coordinates file, if not contained in cloud files (optional)",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-m', '--maskFILE',
+                    help="Boolean mask (.npy) of points to drop, from createMask.py (optional)",
+                    nargs='?',
+                    type=str)
+
+    try:
+        args = CLI.parse_args()
+    except SystemExit:
+        print("Check inputs")
+        quit()
+
+    storeDIR = args.storeDIR if args.storeDIR else os.path.normpath(args.snapsDIR)+'.store'
+    timeNames = None
+    if args.timeList:
+        with open(args.timeList) as f:
+            timeNames = f.read().split()
+    convertTimeDirs(args.snapsDIR, storeDIR, args.fields, timeNames, args.coordFILE,
+                    args.maskFILE)
+
+    print('DONE!')
+
+# ---------------------------------------------------------------------------
+# COMMAND LINE EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Dynamic distribution of tasks (e.g. time indices) across MPI ranks
+    Ranks claim chunks of consecutive task indices from a counter on rank 0
+    (one-sided MPI_Fetch_and_op) when they are ready, so that fast ranks take
+    over the work of slow ones. Per-rank timing is reported at the end.
+"""
+
+import numpy as np
+import time
+from mpi4py import MPI
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class taskScheduler():
+    def __init__(self, comm, nTasks, chunkSize=None, chunksPerRank=8):
+        #- NOTE: Collective; all ranks create the scheduler in the same order
+        self.comm = comm
+        self.nTasks = nTasks
+        #- Default: about `chunksPerRank` chunks per rank
+        if chunkSize is None:
+            chunkSize = -(-nTasks//(comm.Get_size()*chunksPerRank))
+        self.chunkSize = max(1, chunkSize)
+
+        #- Chunk counter, exposed by rank 0
+        #- NOTE: Memory allocated by MPI, so that atomics do not need rank 0
+        #-       to enter MPI (e.g. shared memory on a node, RDMA)
+        itemSize = MPI.INT64_T.Get_size()
+        self.win = MPI.Win.Allocate(itemSize if comm.Get_rank() == 0 else 0,
+                                    itemSize, comm=comm)
+        if comm.Get_rank() == 0:
+            self.win.Lock(0)
+            self.win.Put(np.zeros(1, dtype=np.int64), 0)
+            self.win.Unlock(0)
+
+        #- Statistics
+        self.nChunks = 0
+        self.nDone = 0
+        self.workTime = 0.0
+        self.claimTime = 0.0
+        comm.Barrier()
+        self.startTime = time.perf_counter()
+        self.finishTime = 0.0
+
+    def claim(self):
+        #- Next chunk of task indices (first, end); None once all are handed out
+        tic = time.perf_counter()
+        one = np.ones(1, dtype=np.int64)
+        chunkInd = np.zeros(1, dtype=np.int64)
+        self.win.Lock(0, MPI.LOCK_SHARED)
+        self.win.Fetch_and_op(one, chunkInd, 0, 0, MPI.SUM)
+        self.win.Unlock(0)
+        self.claimTime += time.perf_counter()-tic
+        first = int(chunkInd[0])*self.chunkSize
+        if first >= self.nTasks:
+            self.finishTime = time.perf_counter()-self.startTime
+            return None
+        self.nChunks += 1
+        return first, min(first+self.chunkSize, self.nTasks)
+
+    def chunks(self):
+        #- Chunks (first, end) of the rank, claimed until all are handed out
+        #- NOTE: The time until the next chunk is requested counts as work
+        chunk = self.claim()
+        while chunk is not None:
+            tic = time.perf_counter()
+            yield chunk
+            self.workTime += time.perf_counter()-tic
+            self.nDone += chunk[1]-chunk[0]
+            chunk = self.claim()
+
+    def tasks(self):
+        #- Task indices of the rank
+        for first, end in self.chunks():
+            for i in range(first, end):
+                yield i
+
+    def report(self, label=''):
+        #- Print per-rank statistics on rank 0 and release the counter
+        #- NOTE: Collective
+        stats = self.comm.gather((self.nChunks, self.nDone, self.workTime,
+                                  self.claimTime, self.finishTime), root=0)
+        self.win.Free()
+        if self.comm.Get_rank() != 0:
+            return
+        finish = [s[4] for s in stats]
+        print("Task distribution {0}: {1} tasks, chunk size {2}, "
+              "finish time spread {3:.3f} s".format(
+              label, self.nTasks, self.chunkSize, max(finish)-min(finish)))
+        print("    rank  chunks   tasks    work [s]   claim [s]  finish [s]")
+        for rank, (nChunks, nDone, workTime, claimTime, finishTime) in enumerate(stats):
+            print("    {0:4d} {1:7d} {2:7d} {3:11.3f} {4:11.3f} {5:11.3f}".format(
+                  rank, nChunks, nDone, workTime, claimTime, finishTime))
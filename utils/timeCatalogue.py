@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Catalogue of the time directories of a directory
+    Names are parsed as decimals (100.01 and 100.010 are the same time, 0.01
+    is not 100.01) and sorted numerically. The sorted list is cached next to
+    the directory, in <timeDIR>.times.json, and reused while the modification
+    time of the directory is unchanged.
+RUN:
+    $ python timeCatalogue.py $timeDIR [-r tStart tEnd] [-n nSkip]
+"""
+
+import argparse
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+# ---------------------------------------------------------------------------
+# UTILITY FUNCTION(S)
+# ---------------------------------------------------------------------------
+def parseTime(name):
+    #- Decimal time of a directory name, None if not a time
+    try:
+        t = Decimal(name)
+    except InvalidOperation:
+        return None
+    return t if t.is_finite() else None
+
+def toDecimal(t):
+    #- NOTE: Floats via their shortest representation (100.01, not 100.0100000000000051...)
+    return t if isinstance(t, Decimal) else Decimal(str(t))
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class timeCatalogue():
+    def __init__(self, timeDIR, useCache=True):
+        self.timeDIR = os.path.abspath(timeDIR)
+        self.cacheFILE = os.path.normpath(self.timeDIR)+'.times.json'
+        self.useCache = useCache
+        self.isCached = False
+        self.names = self._load()
+        self.times = [Decimal(name) for name in self.names]
+
+    def select(self, tStart=None, tEnd=None, nSkip=1):
+        #- Names of the times in [tStart, tEnd], every nSkip-th from the first
+        #- NOTE: nSkip=0,1 --> No skipping
+        tStart = None if tStart is None else toDecimal(tStart)
+        tEnd = None if tEnd is None else toDecimal(tEnd)
+        names = [name for name, t in zip(self.names, self.times)
+                 if (tStart is None or t >= tStart) and (tEnd is None or t <= tEnd)]
+        return names[::max(1, int(nSkip))]
+
+    def _load(self):
+        mtime = os.stat(self.timeDIR).st_mtime_ns
+        if self.useCache and os.path.isfile(self.cacheFILE):
+            try:
+                with open(self.cacheFILE) as f:
+                    cache = json.load(f)
+                if cache['timeDIR'] == self.timeDIR and cache['mtime'] == mtime:
+                    self.isCached = True
+                    return cache['names']
+            except (OSError, ValueError, KeyError):
+                pass
+        names = self._scan()
+        if self.useCache:
+            #- NOTE: The cache is optional (e.g. read-only directories)
+            try:
+                tmpFILE = self.cacheFILE+'.tmp'
+                with open(tmpFILE, 'w') as f:
+                    json.dump({'timeDIR': self.timeDIR, 'mtime': mtime, 'names': names}, f)
+                os.replace(tmpFILE, self.cacheFILE)
+            except OSError as e:
+                print("WARNING: Time catalogue not cached: {0}".format(e))
+        return names
+
+    def _scan(self):
+        #- Time directories, listed once
+        entries = []
+        with os.scandir(self.timeDIR) as it:
+            for entry in it:
+                t = parseTime(entry.name)
+                if t is not None and entry.is_dir():
+                    entries.append((t, entry.name))
+        entries.sort()
+        return [name for _, name in entries]
+
+# ---------------------------------------------------------------------------
+# MAIN FUNCTION
+# ---------------------------------------------------------------------------
+def main():
+    #- Read arguments
+    CLI = argparse.ArgumentParser(description='List time directories')
+    CLI.add_argument('timeDIR',
+                    help="Directory containing time directories",
+                    nargs='?',
+                    type=str)
+    CLI.add_argument('-r', '--timeRange',
+                    help="First and last time (inclusive)",
+                    nargs=2,
+                    type=str)
+    CLI.add_argument('-n', '--nSkip',
+                    help="Keep every nSkip-th time",
+                    nargs='?',
+                    type=int,
+                    default=1)
+    args = CLI.parse_args()
+
+    catalogue = timeCatalogue(args.timeDIR)
+    tStart, tEnd = args.timeRange if args.timeRange else (None, None)
+    print('\n'.join(catalogue.select(tStart, tEnd, args.nSkip)))
+
+# ---------------------------------------------------------------------------
+# COMMAND LINE EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
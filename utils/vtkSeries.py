@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Created Date: 18/10/2026
+# ---------------------------------------------------------------------------
+"""
+Time series of point data on a fixed point cloud, for ParaView
+    vtkhdf - one VTKHDF file (transient UnstructuredGrid of vertices): points
+             and cells are written once, point data of each step is appended
+             (requires h5py)
+    pvd    - one .vtu per step (pyevtk) and a .pvd collection with the times
+    Steps are copied and written in batches by a background thread.
+"""
+
+import numpy as np
+import os
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+from backgroundWriter import backgroundWriter
+
+# ---------------------------------------------------------------------------
+# UTILITY FUNCTION(S)
+# ---------------------------------------------------------------------------
+#- VTK cell type of a vertex
+VTK_VERTEX = 1
+
+def pointArrays(data, nPts):
+    #- Point data {name: (nPts,) or (nPts, nv)}; tuples of components as in pyevtk
+    arrays = {}
+    for name, value in data.items():
+        if isinstance(value, tuple):
+            value = np.stack(value, axis=1)
+        value = np.array(value, dtype=float)
+        if value.shape[0] != nPts:
+            raise ValueError("Point data {0} has {1} values, not {2}".format(
+                             name, value.shape[0], nPts))
+        arrays[name] = value.reshape((nPts, -1)) if value.ndim > 1 else value
+    return arrays
+
+# ---------------------------------------------------------------------------
+# SUBFUNCTION(S)
+# ---------------------------------------------------------------------------
+class vtkSeriesWriter():
+    def __init__(self, fileNAME, coord, outFormat='vtkhdf', batchSize=16, depth=2):
+        #- fileNAME without extension; coordinates (nPts, 3)
+        self.fileNAME = fileNAME
+        self.coord = np.asarray(coord, dtype=float)
+        self.nPts = self.coord.shape[0]
+        self.outFormat = outFormat
+        self.batchSize = batchSize
+        self.batch = []
+        self.nSteps = 0
+        Path(os.path.dirname(os.path.abspath(fileNAME))).mkdir(parents=True, exist_ok=True)
+
+        if outFormat == 'vtkhdf':
+            self._openHDF()
+            writeFn = self._writeHDF
+        elif outFormat == 'pvd':
+            self.X = np.ascontiguousarray(self.coord[:,0])
+            self.Y = np.ascontiguousarray(self.coord[:,1])
+            self.Z = np.ascontiguousarray(self.coord[:,2])
+            self.pvdDIR = fileNAME
+            Path(self.pvdDIR).mkdir(parents=True, exist_ok=True)
+            self.pvdSteps = []
+            writeFn = self._writePVD
+        else:
+            raise ValueError("Unknown output format {0}, use vtkhdf or pvd".format(outFormat))
+        self.writer = backgroundWriter(writeFn, depth)
+
+    def write(self, t, data):
+        #- Point data {name: values} at time t
+        #- NOTE: Copied, so that the caller may reuse its buffers
+        self.batch.append((float(t), pointArrays(data, self.nPts)))
+        if len(self.batch) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.writer.put(self.batch)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if self.outFormat == 'vtkhdf':
+            self.h5.close()
+        else:
+            self._savePVD()
+
+    def _openHDF(self):
+        import h5py
+        self.h5FILE = self.fileNAME+'.vtkhdf'
+        self.h5 = h5py.File(self.h5FILE, 'w')
+        root = self.h5.create_group('VTKHDF')
+        root.attrs['Version'] = np.array([2, 0], dtype=np.int64)
+        root.attrs['Type'] = np.bytes_('UnstructuredGrid')
+
+        #- Geometry, shared by all steps: one vertex per point
+        nPts = self.nPts
+        root.create_dataset('NumberOfPoints', data=np.array([nPts], dtype=np.int64))
+        root.create_dataset('NumberOfCells', data=np.array([nPts], dtype=np.int64))
+        root.create_dataset('NumberOfConnectivityIds', data=np.array([nPts], dtype=np.int64))
+        root.create_dataset('Points', data=self.coord)
+        root.create_dataset('Connectivity', data=np.arange(nPts, dtype=np.int64))
+        root.create_dataset('Offsets', data=np.arange(nPts+1, dtype=np.int64))
+        root.create_dataset('Types', data=np.full(nPts, VTK_VERTEX, dtype=np.uint8))
+        root.create_group('PointData')
+
+        #- Steps: geometry offsets are 0 for all steps
+        steps = root.create_group('Steps')
+        steps.attrs['NSteps'] = 0
+        steps.create_group('PointDataOffsets')
+        for name, shape in [('Values', (0,)), ('PartOffsets', (0,)), ('NumberOfParts', (0,)),
+                            ('PointOffsets', (0,)), ('CellOffsets', (0, 1)),
+                            ('ConnectivityIdOffsets', (0, 1))]:
+            steps.create_dataset(name, shape=shape, maxshape=(None,)+shape[1:],
+                                 dtype=float if name == 'Values' else np.int64,
+                                 chunks=(1024,)+shape[1:])
+
+    def _writeHDF(self, batch):
+        root = self.h5['VTKHDF']
+        steps = root['Steps']
+        n0 = self.nSteps
+        n1 = n0+len(batch)
+
+        #- Point data, appended along the first axis
+        for name in batch[0][1]:
+            values = np.concatenate([data[name] for _, data in batch])
+            if name not in root['PointData']:
+                if n0 > 0:
+                    raise KeyError("Point data {0} missing in earlier steps".format(name))
+                root['PointData'].create_dataset(name, shape=(0,)+values.shape[1:],
+                                                 maxshape=(None,)+values.shape[1:],
+                                                 dtype=float,
+                                                 chunks=(min(self.nPts, 1<<16),)+values.shape[1:])
+                steps['PointDataOffsets'].create_dataset(name, shape=(0,), maxshape=(None,),
+                                                         dtype=np.int64, chunks=(1024,))
+            dset = root['PointData'][name]
+            dset.resize(n1*self.nPts, axis=0)
+            dset[n0*self.nPts:n1*self.nPts] = values
+            offsets = steps['PointDataOffsets'][name]
+            offsets.resize((n1,))
+            offsets[n0:n1] = np.arange(n0, n1, dtype=np.int64)*self.nPts
+
+        #- Step metadata
+        for name, values in [('Values', [t for t, _ in batch]),
+                             ('PartOffsets', 0), ('NumberOfParts', 1),
+                             ('PointOffsets', 0), ('CellOffsets', 0),
+                             ('ConnectivityIdOffsets', 0)]:
+            dset = steps[name]
+            dset.resize(n1, axis=0)
+            dset[n0:n1] = np.asarray(values) if name == 'Values' else values
+        steps.attrs['NSteps'] = n1
+        self.h5.flush()
+        self.nSteps = n1
+
+    def _writePVD(self, batch):
+        from pyevtk.hl import pointsToVTK
+        for t, data in batch:
+            #- NOTE: Tuple data is identified as vector in pointsToVTK
+            pointData = {}
+            for name, value in data.items():
+                if value.ndim == 1:
+                    pointData[name] = value
+                elif value.shape[1] == 3:
+                    pointData[name] = tuple(np.ascontiguousarray(value[:,j]) for j in range(3))
+                else:
+                    for j in range(value.shape[1]):
+                        pointData[name+'_'+str(j)] = np.ascontiguousarray(value[:,j])
+            stepFILE = 'step_{0:06d}'.format(self.nSteps)
+            pointsToVTK(os.path.join(self.pvdDIR, stepFILE), self.X, self.Y, self.Z,
+                        data=pointData)
+            self.pvdSteps.append((t, os.path.join(os.path.basename(self.pvdDIR), stepFILE+'.vtu')))
+            self.nSteps += 1
+
+    def _savePVD(self):
+        with open(self.fileNAME+'.pvd', 'w') as f:
+            f.write('<?xml version="1.0"?>\n')
+            f.write('<VTKFile type="Collection" version="0.1">\n<Collection>\n')
+            for t, stepFILE in self.pvdSteps:
+                f.write('<DataSet timestep="{0:.12g}" part="0" file={1}/>\n'.format(
+                        t, quoteattr(stepFILE)))
+            f.write('</Collection>\n</VTKFile>\n')